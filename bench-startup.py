@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+STARTUP BENCHMARK - Entry point import and launch cost
+=======================================================
+Time each command-line entry point and break down its imports with
+python -X importtime, so startup regressions show up before release.
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent
+
+# Commands that return without user input or launching an emulator
+ENTRY_POINTS = {
+    'timemachine --list': ['timemachine.py', '--list'],
+    'timemachine --help': ['timemachine.py', '--help'],
+    'rom-manager --help': ['rom-manager.py', '--help'],
+    'retro-artwork --help': ['retro-artwork.py', '--help'],
+}
+
+
+def parse_importtime(stderr):
+    """{module: (self_us, cumulative_us, depth)} from python -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # The header line
+            continue
+        name = fields[2].rstrip()
+        depth = len(name) - len(name.lstrip())
+        modules[name.strip()] = (int(fields[0]), int(fields[1]), depth)
+    return modules
+
+
+def run_entry_point(argv, env):
+    """Wall time of one run, in milliseconds, and its importtime output"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', *argv], cwd=REPO_DIR, env=env,
+                            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True)
+    return (time.perf_counter() - start) * 1000, result.stderr
+
+
+def bench(name, argv, runs, env):
+    """Median wall time and import breakdown for one entry point"""
+    walls = []
+    imports = {}
+    for _ in range(runs):
+        wall, stderr = run_entry_point(argv, env)
+        walls.append(wall)
+        imports = parse_importtime(stderr)
+    # Top-level imports (depth 1) add up to the whole import cost
+    total_us = sum(cum for _, cum, depth in imports.values() if depth == 1)
+    slowest = sorted(((cum, mod) for mod, (_, cum, depth) in imports.items() if depth == 1),
+                     reverse=True)
+    return {
+        'name': name,
+        'wall_ms': round(statistics.median(walls), 1),
+        'import_ms': round(total_us / 1000, 1),
+        'modules': len(imports),
+        'slowest': [(mod, round(cum / 1000, 1)) for cum, mod in slowest[:5]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time benchmark")
+    parser.add_argument("entry_points", nargs='*', metavar="NAME",
+                       help=f"Entry points to time (default: all of {', '.join(ENTRY_POINTS)})")
+    parser.add_argument("-n", "--runs", type=int, default=5,
+                       help="Runs per entry point; the median is reported (default: %(default)s)")
+    parser.add_argument("--save", metavar="FILE",
+                       help="Save results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE",
+                       help="Compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=20.0, metavar="PCT",
+                       help="Import time increase that counts as a regression "
+                            "(default: %(default)s%%)")
+    args = parser.parse_args()
+
+    names = args.entry_points or list(ENTRY_POINTS)
+    unknown = [n for n in names if n not in ENTRY_POINTS]
+    if unknown:
+        print(f"Unknown entry points: {', '.join(unknown)}")
+        sys.exit(2)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {r['name']: r for r in json.load(f)}
+
+    regressions = []
+    results = []
+    # A throwaway HOME keeps the runs from touching real caches and config
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home)
+        for name in names:
+            result = bench(name, ENTRY_POINTS[name], args.runs, env)
+            results.append(result)
+            line = (f"  {name:22} wall {result['wall_ms']:7.1f} ms   "
+                    f"imports {result['import_ms']:7.1f} ms   {result['modules']:4} modules")
+            before = baseline.get(name)
+            if before and before['import_ms']:
+                change = (result['import_ms'] - before['import_ms']) / before['import_ms'] * 100
+                line += f"   {change:+.0f}%"
+                if change > args.threshold:
+                    regressions.append(name)
+                    line += "  [✗] regression"
+            print(line)
+            for mod, ms in result['slowest']:
+                print(f"      {ms:7.1f} ms  {mod}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"[*] Baseline saved: {args.save}")
+    if regressions:
+        print(f"[✗] Import time regressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
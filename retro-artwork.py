@@ -9,11 +9,29 @@ import os
 import sys
 import json
 import time
+import itertools
+import heapq
+import re
+import unicodedata
+import random
+import hashlib
+import sqlite3
 import argparse
+import threading
+import http.client
 import urllib.request
 import urllib.parse
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor, as_completed,
+                                wait, FIRST_COMPLETED)
+from array import array
 from pathlib import Path
 
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
 BANNER = """
 ██████╗ ███████╗████████╗██████╗  ██████╗      █████╗ ██████╗ ████████╗
 ██╔══██╗██╔════╝╚══██╔══╝██╔══██╗██╔═══██╗    ██╔══██╗██╔══██╗╚══██╔══╝
@@ -41,13 +59,885 @@ PLATFORM_IDS = {
     }
 }
 
+# Lookup cache shared with the rest of the Time Machine's state
+CACHE_FILE = Path.home() / ".timemachine" / "cache" / "artwork.db"
+CACHE_BUDGET = 64 * 1024 * 1024
+NEGATIVE_TTL = 7 * 24 * 3600
+
+# Gallery thumbnails: <output>/.thumbs/<sha1[:2]>/<sha1>-<w>x<h>.<ext>, keyed
+# by the source image's content so unchanged art is never rescaled
+THUMB_DIR = ".thumbs"
+THUMB_SIZE = (240, 240)
+THUMB_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+# LibRetro thumbnail server and its per-system directory names
+LIBRETRO_BASE_URL = "https://thumbnails.libretro.com"
+LIBRETRO_SYSTEMS = {
+    'nes': 'Nintendo - Nintendo Entertainment System',
+    'snes': 'Nintendo - Super Nintendo Entertainment System',
+    'n64': 'Nintendo - Nintendo 64',
+    'gamecube': 'Nintendo - GameCube',
+    'gameboy': 'Nintendo - Game Boy',
+    'gba': 'Nintendo - Game Boy Advance',
+    'genesis': 'Sega - Mega Drive - Genesis',
+    'mastersystem': 'Sega - Master System - Mark III',
+    'psx': 'Sony - PlayStation',
+    'ps2': 'Sony - PlayStation 2',
+    'arcade': 'MAME',
+    'c64': 'Commodore - 64',
+    'amiga': 'Commodore - Amiga',
+    'atari2600': 'Atari - 2600',
+    'atari7800': 'Atari - 7800',
+    'lynx': 'Atari - Lynx',
+}
+LIBRETRO_DIRS = {'boxart': 'Named_Boxarts', 'title': 'Named_Titles', 'snap': 'Named_Snaps'}
+
+# Known-name listings change rarely; fuzzy matches below MATCH_THRESHOLD are
+# reported as candidates rather than used
+NAMES_TTL = 30 * 24 * 3600
+MATCH_THRESHOLD = 0.75
+CANDIDATE_THRESHOLD = 0.4
+
+# Artwork files are <output>/<platform>/<game>/<type><ext>; when several
+# extensions exist for a type, the later one in ART_EXTENSIONS wins
+ART_TYPES = ('boxart', 'title', 'snap', 'logo')
+ART_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Seconds an NDJSON catalog may stop growing before its missing stats
+# trailer is taken to mean it was truncated rather than still being written
+CATALOG_FOLLOW_TIMEOUT = 10.0
+
+
+# Gallery pages are script shards (galleryPage(n, [...])) rather than .json
+# files so they also load when the gallery is opened from file://
+GALLERY_PAGE_SIZE = 200
+GALLERY_HTML = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Retro Game Gallery</title>
+    <style>
+        body { 
+            background: #1a1a2e; 
+            color: #00ff00; 
+            font-family: 'Courier New', monospace;
+            padding: 20px;
+        }
+        h1 { 
+            text-align: center; 
+            color: #00ff00;
+            text-shadow: 0 0 10px #00ff00;
+        }
+        .gallery { 
+            display: grid; 
+            grid-template-columns: repeat(auto-fill, minmax(200px, 1fr));
+            gap: 20px;
+        }
+        .game-card {
+            background: #16213e;
+            border: 2px solid #00ff00;
+            padding: 10px;
+            text-align: center;
+        }
+        .game-card img {
+            max-width: 100%;
+            height: 150px;
+            object-fit: contain;
+        }
+        .game-card .title {
+            margin-top: 10px;
+            font-size: 12px;
+            white-space: nowrap;
+            overflow: hidden;
+            text-overflow: ellipsis;
+        }
+        .game-card .platform {
+            color: #888;
+            font-size: 10px;
+        }
+        .placeholder {
+            background: #0a0a0a;
+            height: 150px;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            border: 1px dashed #00ff00;
+        }
+        #search {
+            background: #0a0a0a;
+            color: #00ff00;
+            border: 1px solid #00ff00;
+            font-family: inherit;
+            padding: 6px;
+            width: 320px;
+        }
+        .pager {
+            text-align: center;
+            margin: 20px;
+        }
+        .pager button {
+            background: #16213e;
+            color: #00ff00;
+            border: 1px solid #00ff00;
+            font-family: inherit;
+            padding: 4px 12px;
+        }
+    </style>
+</head>
+<body>
+    <h1>🎮 N01D TIME MACHINE - GAME GALLERY</h1>
+    <p style="text-align:center" id="stats"></p>
+    <p style="text-align:center">
+        <input id="search" type="search" placeholder="Search games or platforms..."
+               autocomplete="off" oninput="onSearch(event)">
+    </p>
+    <div class="pager"></div>
+    <div class="gallery" id="gallery"></div>
+    <div class="pager"></div>
+    <script>
+    const PAGES = "__PAGES__";
+    const SEARCH_LIMIT = 200;
+    let pageCount = 1, pageSize = 200, current = 0, query = '', searchTimer = null;
+    let pageRequest = 0;
+    const pageCache = {}, shardCache = {};
+    const observer = 'IntersectionObserver' in window ? new IntersectionObserver(entries => {
+        for (const entry of entries) {
+            if (entry.isIntersecting) {
+                entry.target.src = entry.target.dataset.src;
+                observer.unobserve(entry.target);
+            }
+        }
+    }, {rootMargin: '300px'}) : null;
+    
+    function loadScript(src) {
+        return new Promise(resolve => {
+            const script = document.createElement('script');
+            script.src = src;
+            script.onload = script.onerror = () => { script.remove(); resolve(); };
+            document.head.appendChild(script);
+        });
+    }
+    async function loadPage(n) {
+        if (!(n in pageCache)) await loadScript(`${PAGES}/page-${String(n).padStart(5, '0')}.js`);
+        return pageCache[n] || [];
+    }
+    async function loadShard(key) {
+        if (!(key in shardCache)) await loadScript(`${PAGES}/search/${key}.js`);
+        return shardCache[key] || {};
+    }
+    function galleryIndex(index) {
+        pageCount = Math.max(1, index.pages);
+        pageSize = index.page_size;
+        const s = index.stats;
+        document.getElementById('stats').textContent =
+            `Total: ${s.total} | With Art: ${s.with_art} | Missing: ${s.missing}`;
+        showPage(parseInt(location.hash.slice(1)) || 1);
+    }
+    function galleryPage(n, games) { pageCache[n] = games; }
+    function gallerySearchShard(key, postings) { shardCache[key] = postings; }
+    
+    function setPagers(status, buttons) {
+        for (const pager of document.querySelectorAll('.pager')) {
+            pager.textContent = '';
+            for (const [label, target] of buttons) {
+                const button = document.createElement('button');
+                button.textContent = label;
+                button.disabled = target < 1 || target > pageCount;
+                button.onclick = () => { showPage(target); scrollTo(0, 0); };
+                pager.append(button, ' ');
+            }
+            pager.insertBefore(document.createTextNode(` ${status} `), pager.lastChild);
+        }
+    }
+    async function showPage(n) {
+        // Only the latest request renders; n itself may be out of range
+        const request = ++pageRequest;
+        current = Math.min(Math.max(1, n), pageCount);
+        history.replaceState(null, '', '#' + current);
+        setPagers(`Page ${current} / ${pageCount}`,
+                  [['« Prev', current - 1], ['Next »', current + 1]]);
+        const games = await loadPage(current);
+        if (!query && request === pageRequest) renderCards(games);
+    }
+    
+    // Must match search_tokens() in retro-artwork.py
+    function tokens(text) {
+        return text.normalize('NFKD').replace(/[\\u0300-\\u036f]/g, '').toLowerCase()
+                   .match(/[a-z0-9]+/g) || [];
+    }
+    async function search(q) {
+        query = q;
+        const words = tokens(q);
+        // Shards are keyed by two characters, so a one-character word only
+        // matches whole tokens; while it is still being typed, leave it out
+        if (words.length && words[words.length - 1].length < 2 && !/\\s$/.test(q)) words.pop();
+        if (!words.length) {
+            if (!tokens(q).length) { query = ''; showPage(current); return; }
+            setPagers('Type at least 2 characters to search', []);
+            renderCards([]);
+            return;
+        }
+        let ids = null;
+        for (const word of words) {
+            // Shards are keyed by the first two characters of each token
+            const shard = await loadShard(word.slice(0, 2));
+            const found = new Set();
+            for (const token in shard) {
+                if (!token.startsWith(word)) continue;
+                let id = 0;
+                for (const delta of shard[token]) { id += delta; found.add(id); }
+            }
+            ids = ids ? new Set([...ids].filter(id => found.has(id))) : found;
+            if (!ids.size) break;
+        }
+        const hits = [...ids].sort((a, b) => a - b);
+        const games = [];
+        for (const id of hits.slice(0, SEARCH_LIMIT)) {
+            const page = await loadPage(Math.floor(id / pageSize) + 1);
+            games.push(page[id % pageSize]);
+        }
+        if (query !== q) return;
+        setPagers(`${hits.length} matches` +
+                  (hits.length > games.length ? ` (showing ${games.length})` : ''), []);
+        renderCards(games);
+    }
+    function onSearch(event) {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => search(event.target.value), 150);
+    }
+    
+    function renderCards(games) {
+        const gallery = document.getElementById('gallery');
+        const cards = document.createDocumentFragment();
+        for (const [name, platform, art] of games) {
+            const card = document.createElement('div');
+            card.className = 'game-card';
+            if (art) {
+                const img = document.createElement('img');
+                img.alt = name;
+                img.loading = 'lazy';
+                if (observer) { img.dataset.src = art; observer.observe(img); } else img.src = art;
+                card.append(img);
+            } else {
+                const placeholder = document.createElement('div');
+                placeholder.className = 'placeholder';
+                placeholder.textContent = 'No Art';
+                card.append(placeholder);
+            }
+            for (const [cls, text] of [['title', name], ['platform', platform]]) {
+                const div = document.createElement('div');
+                div.className = cls;
+                div.textContent = text;
+                div.title = text;
+                card.append(div);
+            }
+            cards.append(card);
+        }
+        if (observer) gallery.querySelectorAll('img').forEach(img => observer.unobserve(img));
+        gallery.replaceChildren(cards);
+    }
+    loadScript(`${PAGES}/index.js`);
+    </script>
+</body>
+</html>
+"""
+
+
+def iter_ndjson_catalog(catalog_file, follow=CATALOG_FOLLOW_TIMEOUT):
+    """Yield ROM records from a streaming NDJSON catalog, one line at a time
+    
+    The file is followed as rom-manager appends to it until the stats
+    trailer arrives. If it stops growing for follow seconds first, it was
+    truncated or its writer died: a warning is printed and the records read
+    so far are all there is.
+    """
+    with open(catalog_file) as f:
+        partial = ''
+        idle_since = None
+        while True:
+            line = f.readline()
+            if not line:
+                now = time.monotonic()
+                if idle_since is None:
+                    idle_since = now
+                elif now - idle_since >= follow:
+                    break
+                time.sleep(min(0.2, follow))
+                continue
+            idle_since = None
+            # A line the writer hasn't finished yet
+            partial += line
+            if not partial.endswith('\n'):
+                continue
+            line, partial = partial, ''
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record.pop('record', None)
+            if kind == 'rom':
+                yield record
+            elif kind == 'stats':
+                return
+    print(f"[✗] {catalog_file} has no stats trailer; the catalog may be incomplete")
+
+
+def iter_sqlite_catalog(catalog_file):
+    """Yield ROM records from a rom-manager --db catalog without loading it all"""
+    db = sqlite3.connect(f"file:{catalog_file}?mode=ro", uri=True)
+    try:
+        for name, platform, path in db.execute(
+                "SELECT name, platform, path FROM roms ORDER BY platform, name"):
+            yield {'name': name, 'platform': platform, 'path': path}
+    finally:
+        db.close()
+
+
+def load_catalog(catalog_file):
+    """Load a rom-manager catalog exported as JSON, streaming NDJSON or SQLite
+    
+    NDJSON and SQLite catalogs are not read up front: 'roms' is a generator.
+    An NDJSON catalog that is still being written is consumed as it grows,
+    until its stats trailer (see iter_ndjson_catalog).
+    """
+    with open(catalog_file, 'rb') as f:
+        if f.read(16) == b'SQLite format 3\x00':
+            return {'roms': iter_sqlite_catalog(catalog_file)}
+    with open(catalog_file) as f:
+        first_line = f.readline()
+    try:
+        header = json.loads(first_line)
+    except ValueError:
+        header = None
+    if isinstance(header, dict) and 'record' in header:
+        return {'roms': iter_ndjson_catalog(catalog_file)}
+        
+    with open(catalog_file) as f:
+        return json.load(f)
+
+
+def image_metadata(path):
+    """Size, mtime and SHA1 of an image file, as stored in the lookup cache"""
+    st = os.stat(path)
+    with open(path, 'rb') as f:
+        sha1 = hashlib.sha1(f.read()).hexdigest()
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': sha1}
+
+
+def make_thumbnail(source, dest, size=THUMB_SIZE, fmt='webp'):
+    """Worker entry point: scale source to fit size and write it to dest
+    
+    draft() lets the JPEG decoder skip straight to a reduced scale, and
+    thumbnail() reduces by whole factors before the final resample, so
+    large box art is never fully decoded and resampled. Returns dest, or
+    None if the image can't be read or this Pillow build can't write fmt,
+    so the caller falls back to the full-size art.
+    """
+    part = f"{dest}.part"
+    try:
+        with Image.open(source) as im:
+            im.draft('RGB', size)
+            im.thumbnail(size, Image.LANCZOS, reducing_gap=2.0)
+            if fmt == 'jpeg' and im.mode != 'RGB':
+                im = im.convert('RGB')
+            elif im.mode not in ('RGB', 'RGBA'):
+                im = im.convert('RGBA')
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            # KeyError: no encoder for this format in the Pillow build
+            im.save(part, THUMB_FORMATS[fmt], quality=80)
+        os.replace(part, dest)
+    except (OSError, ValueError, KeyError, Image.DecompressionBombError):
+        dest = None
+    finally:
+        if os.path.lexists(part):
+            os.unlink(part)
+    return dest
+
+
+class LookupCache:
+    """Persistent LRU cache of JSON values, grouped by namespace
+    
+    Entries live in SQLite and are evicted least-recently-used first once
+    their total size passes the byte budget. Negative results ("no art
+    for X") are stored with a TTL so they are retried eventually. Access
+    times are buffered and written on commit.
+    """
+    
+    MISS = object()
+    
+    def __init__(self, cache_file=CACHE_FILE, budget=CACHE_BUDGET):
+        self.cache_file = Path(cache_file)
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self.budget = budget
+        self.db = sqlite3.connect(str(self.cache_file))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT, key TEXT, value TEXT, size INTEGER,
+                expires REAL, accessed REAL,
+                PRIMARY KEY (namespace, key));
+            CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+        """)
+        self.total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        self.memory = {}
+        self.touched = {}
+        self.hits = self.misses = 0
+        
+    def get(self, namespace, key, default=MISS):
+        """Cached value, or default if absent or expired"""
+        now = time.time()
+        entry = self.memory.get((namespace, key))
+        if entry is None:
+            row = self.db.execute(
+                "SELECT value, expires FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, key)).fetchone()
+            if row is not None:
+                entry = self.memory[(namespace, key)] = (json.loads(row[0]), row[1])
+        if entry is None or (entry[1] is not None and entry[1] < now):
+            self.misses += 1
+            return default
+        self.touched[(namespace, key)] = now
+        self.hits += 1
+        return entry[0]
+        
+    def set(self, namespace, key, value, ttl=None):
+        now = time.time()
+        data = json.dumps(value)
+        expires = now + ttl if ttl is not None else None
+        old = self.db.execute("SELECT size FROM entries WHERE namespace = ? AND key = ?",
+                              (namespace, key)).fetchone()
+        self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                        (namespace, key, data, len(data), expires, now))
+        self.total += len(data) - (old[0] if old else 0)
+        self.memory[(namespace, key)] = (value, expires)
+        self.touched.pop((namespace, key), None)
+        if self.total > self.budget:
+            self.evict()
+            
+    def evict(self):
+        """Drop expired entries, then the least recently used, to 90% of the budget"""
+        self._write_access_times()
+        self.db.execute("DELETE FROM entries WHERE expires < ?", (time.time(),))
+        self.total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        target = self.budget * 9 // 10
+        cursor = self.db.execute("SELECT namespace, key, size FROM entries ORDER BY accessed")
+        doomed = []
+        for namespace, key, size in cursor:
+            if self.total <= target:
+                break
+            doomed.append((namespace, key))
+            self.total -= size
+        self.db.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", doomed)
+        for item in doomed:
+            self.memory.pop(item, None)
+            
+    def _write_access_times(self):
+        if self.touched:
+            self.db.executemany(
+                "UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?",
+                ((t, ns, key) for (ns, key), t in self.touched.items()))
+            self.touched = {}
+            
+    def commit(self):
+        self._write_access_times()
+        self.db.commit()
+        
+    def close(self):
+        self.commit()
+        self.db.close()
+
+
+class TokenBucket:
+    """Thread-safe token bucket: rate requests per second, bursts of up to burst"""
+    
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ArtworkDownloader:
+    """Fetch artwork into <output>/<platform>/<game>/<type>.png from a thumbnail server
+    
+    Jobs live in an SQLite queue inside the output directory, so an
+    interrupted scrape resumes where it stopped. Worker threads keep one
+    HTTP connection per host open across requests, share a per-host token
+    bucket, retry transient failures with exponential backoff, and
+    revalidate finished downloads with ETag / If-Modified-Since. Files are
+    written to a temporary name and renamed into place.
+    """
+    
+    QUEUE_FILE = ".download-queue.db"
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    
+    def __init__(self, scraper, workers=8, rate=10.0, retries=4, timeout=30):
+        self.scraper = scraper
+        self.output_dir = scraper.output_dir
+        self.cache = scraper.cache
+        self.workers = workers
+        self.rate = rate
+        self.retries = retries
+        self.timeout = timeout
+        self.buckets = {}
+        self.buckets_lock = threading.Lock()
+        self.local = threading.local()
+        self.db = sqlite3.connect(str(self.output_dir / self.QUEUE_FILE))
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                url TEXT PRIMARY KEY, dest TEXT, status TEXT DEFAULT 'pending',
+                etag TEXT, last_modified TEXT, attempts INTEGER DEFAULT 0, error TEXT);
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+        """)
+        
+    def thumbnail_url(self, game_name, platform, art_type):
+        result = self.scraper.search_libretro_thumbnails(game_name, platform)
+        return result['url_template'].replace('{type}', LIBRETRO_DIRS[art_type])
+        
+    def enqueue_catalog(self, rom_catalog, existing=None, art_types=tuple(LIBRETRO_DIRS)):
+        """Queue artwork for the catalog; returns how many jobs were new
+        
+        existing is an ArtworkScraper.index_artwork() result; art types a
+        game already has locally are not queued.
+        """
+        existing = existing or {}
+        before = self.db.total_changes
+        with self.db:
+            for rom in rom_catalog.get('roms', []):
+                artwork_dir = self.output_dir / rom['platform'] / rom['name']
+                have = existing.get((rom['platform'], rom['name']), ())
+                for art_type in art_types:
+                    if art_type in have:
+                        continue
+                    dest = artwork_dir / f"{art_type}.png"
+                    self.db.execute(
+                        "INSERT OR IGNORE INTO jobs (url, dest) VALUES (?, ?)",
+                        (self.thumbnail_url(rom['name'], rom['platform'], art_type), str(dest)))
+        return self.db.total_changes - before
+        
+    def run(self, refresh=False):
+        """Work through the queue; with refresh, finished files are revalidated too
+        
+        Returns counts by outcome: downloaded, unchanged, missing, failed.
+        """
+        statuses = ['pending', 'failed', 'missing'] + (['done'] if refresh else [])
+        jobs = self.db.execute(
+            f"SELECT url, dest, status, etag, last_modified FROM jobs "
+            f"WHERE status IN ({', '.join('?' * len(statuses))})", statuses).fetchall()
+        # Known misses are only asked for again once their cache entry expires
+        jobs = [job for job in jobs if job[2] != 'missing' or
+                self.cache.get('missing', job[0], None) is None]
+        counts = {'downloaded': 0, 'unchanged': 0, 'missing': 0, 'failed': 0}
+        jobs_by_url = {job[0]: job[1] for job in jobs}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self._fetch, *job): job[0] for job in jobs}
+            for n, future in enumerate(as_completed(futures), 1):
+                outcome, etag, last_modified, error = future.result()
+                counts[outcome] += 1
+                if outcome == 'missing':
+                    self.cache.set('missing', futures[future], True, NEGATIVE_TTL)
+                elif outcome == 'downloaded':
+                    dest = jobs_by_url[futures[future]]
+                    self.cache.set('image', dest, image_metadata(dest))
+                status = {'downloaded': 'done', 'unchanged': 'done'}.get(outcome, outcome)
+                self.db.execute(
+                    "UPDATE jobs SET status = ?, etag = COALESCE(?, etag), "
+                    "last_modified = COALESCE(?, last_modified), attempts = attempts + 1, "
+                    "error = ? WHERE url = ?",
+                    (status, etag, last_modified, error, futures[future]))
+                if n % 100 == 0:
+                    self.db.commit()
+        self.db.commit()
+        self.cache.commit()
+        return counts
+        
+    def _bucket(self, host):
+        with self.buckets_lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate)
+            return self.buckets[host]
+            
+    def _connection(self, scheme, host):
+        """This thread's keep-alive connection to host"""
+        connections = self.local.__dict__.setdefault('connections', {})
+        conn = connections.get((scheme, host))
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = connections[(scheme, host)] = cls(host, timeout=self.timeout)
+        return conn
+        
+    def _drop_connection(self, scheme, host):
+        conn = self.local.__dict__.get('connections', {}).pop((scheme, host), None)
+        if conn:
+            conn.close()
+            
+    def _fetch(self, url, dest, status, etag, last_modified):
+        """Download one job; returns (outcome, etag, last_modified, error)"""
+        parts = urllib.parse.urlsplit(url)
+        target = parts.path + (f"?{parts.query}" if parts.query else '')
+        headers = {'User-Agent': 'n01d-timemachine/1.0'}
+        if status == 'done' and os.path.exists(dest):
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+                
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(min(60, 2 ** attempt) * (0.5 + random.random() / 2))
+            self._bucket(parts.netloc).acquire()
+            try:
+                conn = self._connection(parts.scheme, parts.netloc)
+                conn.request('GET', target, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                self._drop_connection(parts.scheme, parts.netloc)
+                error = str(e) or type(e).__name__
+                continue
+            if response.getheader('Connection', '').lower() == 'close':
+                self._drop_connection(parts.scheme, parts.netloc)
+                
+            if response.status == 304:
+                return 'unchanged', None, None, None
+            if response.status == 404:
+                return 'missing', None, None, None
+            if response.status in self.RETRY_STATUSES:
+                error = f"HTTP {response.status}"
+                retry_after = response.getheader('Retry-After', '')
+                if retry_after.isdigit():
+                    time.sleep(min(60, int(retry_after)))
+                continue
+            if response.status != 200:
+                return 'failed', None, None, f"HTTP {response.status}"
+                
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            part = f"{dest}.part"
+            with open(part, 'wb') as f:
+                f.write(body)
+            os.replace(part, dest)
+            return ('downloaded', response.getheader('ETag'),
+                    response.getheader('Last-Modified'), None)
+        return 'failed', None, None, error
+        
+    def close(self):
+        self.db.close()
+
+
+def search_tokens(text):
+    """Lowercase ASCII words of text with accents stripped, as the gallery search sees them"""
+    text = re.sub('[\u0300-\u036f]', '', unicodedata.normalize('NFKD', text))
+    return re.findall(r'[a-z0-9]+', text.lower())
+
+
+ROMAN_NUMERAL = re.compile(r'^x{0,3}(ix|iv|v?i{0,3})$')
+ROMAN_VALUES = {'i': 1, 'v': 5, 'x': 10}
+ARTICLES = {'the', 'a', 'an'}
+
+
+def _roman_to_int(token):
+    total = 0
+    for ch, nxt in itertools.zip_longest(token, token[1:]):
+        value = ROMAN_VALUES[ch]
+        total += -value if nxt and ROMAN_VALUES[nxt] > value else value
+    return total
+
+
+def split_title(name):
+    """Split a ROM or thumbnail name into (normalized key, set of tags, literal key)
+    
+    Bracketed tags like (USA) (Rev 1) [!] are set aside, "Title, The" and
+    leading articles are dropped, '&' reads as 'and', and roman numerals
+    up to 39 become digits, so "Final Fantasy III (USA)" and
+    "final fantasy 3" share the key "final fantasy 3". A one-letter word
+    (I, V, X) only counts as a numeral at the end of a title, so "X-Men"
+    keeps its X. The literal key is the same without numerals converted.
+    """
+    tags = {tag.strip().lower() for group in re.findall(r'[(\[]([^)\]]*)[)\]]', name)
+            for tag in group.split(',')}
+    title = re.sub(r'[(\[][^)\]]*[)\]]', ' ', name).replace('&', ' and ')
+    title = re.sub(r',\s*(the|a|an)\b(?=\s*(-|:|$))', '', title.strip(), flags=re.IGNORECASE)
+    words = search_tokens(title)
+    if len(words) > 1 and words[0] in ARTICLES:
+        words = words[1:]
+    literal = ' '.join(words)
+    if len(words) > 1:
+        last = len(words) - 1
+        words = [str(_roman_to_int(w)) if ROMAN_NUMERAL.match(w) and w and
+                 (len(w) > 1 or i == last) else w for i, w in enumerate(words)]
+    return ' '.join(words), tags, literal
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameMatcher:
+    """Resolve game names against a list of known titles
+    
+    Names are indexed by normalized key for exact hits, and by character
+    trigrams for fuzzy ones: candidates are the titles sharing trigrams
+    with the query, ranked by Dice similarity. Ties between titles with the
+    same key go to the one spelled the same before numerals were converted
+    ("Mega Man 10" over "Mega Man X"), then to the one whose tags overlap
+    most (regional variants).
+    """
+    
+    def __init__(self, names):
+        self.names = list(names)
+        self.tags = []
+        self.literals = []
+        self.gram_counts = array('I')
+        self.exact = {}
+        self.postings = {}
+        for i, name in enumerate(self.names):
+            key, tags, literal = split_title(name)
+            self.tags.append(tags)
+            self.literals.append(literal)
+            self.exact.setdefault(key, []).append(i)
+            grams = trigrams(key)
+            self.gram_counts.append(len(grams))
+            for gram in grams:
+                if gram not in self.postings:
+                    self.postings[gram] = array('I')
+                self.postings[gram].append(i)
+                
+    def match(self, name, limit=5):
+        """Ranked [(score, known name)], best first; score 1.0 is an exact key match"""
+        key, tags, literal = split_title(name)
+        
+        def rank(i, score):
+            return (score, self.literals[i] == literal, len(tags & self.tags[i]),
+                    -len(self.tags[i]), -i)
+            
+        if key in self.exact:
+            hits = sorted(self.exact[key], key=lambda i: rank(i, 1.0), reverse=True)
+            return [(1.0, self.names[i]) for i in hits[:limit]]
+            
+        grams = trigrams(key)
+        common = {}
+        for gram in grams:
+            for i in self.postings.get(gram, ()):
+                common[i] = common.get(i, 0) + 1
+        scored = ((2 * n / (len(grams) + self.gram_counts[i]), i) for i, n in common.items())
+        best = heapq.nlargest(limit, (rank(i, score) for score, i in scored
+                                      if score >= CANDIDATE_THRESHOLD))
+        return [(round(score, 3), self.names[-neg_i]) for score, *_, neg_i in best]
+
+
+def iter_manifest_games(manifest_file):
+    """Yield manifest entries from a manifest.json without loading the whole file
+    
+    write_artwork_manifest puts one entry per line; other layouts are
+    loaded with json.load.
+    """
+    with open(manifest_file) as f:
+        header = [f.readline().strip(), f.readline().strip()]
+        first = f.readline().strip().rstrip(',')
+        if header != ['{', '"games": ['] or (first.startswith('{') and not first.endswith('}')):
+            f.seek(0)
+            yield from json.load(f)['games']
+            return
+        for line in itertools.chain([first], f):
+            line = line.strip().rstrip(',')
+            if not line.startswith('{'):
+                break
+            yield json.loads(line)
+
+
 class ArtworkScraper:
     """Scrape game artwork from various sources"""
     
-    def __init__(self, output_dir):
+    def __init__(self, output_dir, base_url=LIBRETRO_BASE_URL, cache=None):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
-        self.cache = {}
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache if cache is not None else LookupCache()
+        self.matching = False
+        self.names_override = None
+        self.matchers = {}
+        
+    def enable_matching(self, names=None):
+        """Resolve names against known thumbnails; names overrides the server listings"""
+        self.matching = True
+        self.names_override = list(names) if names is not None else None
+        self.matchers = {}
+        
+    def known_names(self, platform):
+        """Thumbnail names the server has for a platform, from its directory listing
+        
+        Returns None if the listing could not be fetched or named no images
+        (an error page, say); that is not cached, so the next run retries.
+        """
+        if self.names_override is not None:
+            return self.names_override
+        system = urllib.parse.quote(LIBRETRO_SYSTEMS.get(platform, platform))
+        url = f"{self.base_url}/{system}/{LIBRETRO_DIRS['boxart']}/"
+        names = self.cache.get('names', url)
+        if names is LookupCache.MISS:
+            try:
+                with urllib.request.urlopen(url, timeout=30) as response:
+                    listing = response.read().decode('utf-8', 'replace')
+            except OSError:
+                return None
+            names = sorted({urllib.parse.unquote(href)[:-4]
+                            for href in re.findall(r'href="([^"/?]+\.png)"', listing)})
+            if not names:
+                return None
+            self.cache.set('names', url, names, NAMES_TTL)
+        return names
+        
+    def resolve_name(self, game_name, platform):
+        """Best known thumbnail name for a game, with ranked candidates
+        
+        Returns {'name': known name or None, 'candidates': [(score, name)]};
+        'name' is only set when the best candidate clears MATCH_THRESHOLD.
+        """
+        source = 'override' if self.names_override is not None else self.base_url
+        key = f"{source}\0{platform}\0{game_name}"
+        result = self.cache.get('match', key)
+        if result is not LookupCache.MISS:
+            return result
+        if platform not in self.matchers:
+            # None remembers an unavailable listing for the rest of this run only
+            names = self.known_names(platform)
+            self.matchers[platform] = NameMatcher(names) if names is not None else None
+        matcher = self.matchers[platform]
+        if matcher is None:
+            return {'name': None, 'candidates': []}
+        candidates = matcher.match(game_name)
+        best = candidates[0] if candidates and candidates[0][0] >= MATCH_THRESHOLD else None
+        result = {'name': best[1] if best else None, 'candidates': candidates}
+        self.cache.set('match', key, result, None if best else NEGATIVE_TTL)
+        return result
+        
+    def libretro_name(self, game_name):
+        """Thumbnail file name LibRetro uses for a game"""
+        return game_name.replace(':', ' -').replace('/', '_')
+        
+    def image_info(self, path):
+        """Cached image_metadata for path, recomputed only if the file changed"""
+        st = os.stat(path)
+        info = self.cache.get('image', str(path))
+        if (info is LookupCache.MISS or info['size'] != st.st_size or
+                info['mtime_ns'] != st.st_mtime_ns):
+            info = image_metadata(path)
+            self.cache.set('image', str(path), info)
+        return info
         
     def generate_local_artwork(self, game_name, platform, style='boxart'):
         """Generate placeholder ASCII art"""
@@ -86,9 +976,14 @@ class ArtworkScraper:
         return art.strip()
         
     def search_libretro_thumbnails(self, game_name, platform):
-        """Search LibRetro thumbnail database (local path format)"""
+        """Search LibRetro thumbnail database (local path format)
+        
+        Not cached itself: building the URLs is cheaper than a cache lookup,
+        and the fuzzy match behind them is cached by resolve_name.
+        """
         # LibRetro uses specific naming conventions
-        clean_name = game_name.replace(':', ' -').replace('/', '_')
+        match = self.resolve_name(game_name, platform) if self.matching else None
+        clean_name = match['name'] if match and match['name'] else self.libretro_name(game_name)
         
         base_paths = {
             'boxart': f"Named_Boxarts/{clean_name}.png",
@@ -96,137 +991,220 @@ class ArtworkScraper:
             'snap': f"Named_Snaps/{clean_name}.png"
         }
         
-        return {
+        system = urllib.parse.quote(LIBRETRO_SYSTEMS.get(platform, platform))
+        result = {
             'platform': platform,
             'game': game_name,
             'paths': base_paths,
-            'url_template': f"https://thumbnails.libretro.com/{platform}/{{type}}/{urllib.parse.quote(clean_name)}.png"
+            'url_template': f"{self.base_url}/{system}/{{type}}/{urllib.parse.quote(clean_name)}.png"
         }
+        if match:
+            result['match'] = match
+        return result
         
-    def create_artwork_manifest(self, rom_catalog):
-        """Create artwork manifest from ROM catalog"""
-        manifest = {
-            'games': [],
-            'stats': {'total': 0, 'with_art': 0, 'missing': 0}
-        }
+    def index_artwork(self):
+        """Map (platform, game) to {art type: path} with one scandir per directory
+        
+        Only games that have artwork get an entry, so the index stays small
+        for sparse collections.
+        """
+        rank = {ext: i for i, ext in enumerate(ART_EXTENSIONS)}
+        index = {}
+        try:
+            platforms = [e for e in os.scandir(self.output_dir) if e.is_dir()]
+        except OSError:
+            return index
+        for platform in platforms:
+            try:
+                games = [e for e in os.scandir(platform.path) if e.is_dir()]
+            except OSError:
+                continue
+            for game in games:
+                found = {}
+                try:
+                    with os.scandir(game.path) as it:
+                        for entry in it:
+                            art_type, dot, ext = entry.name.rpartition('.')
+                            ext = dot + ext
+                            if art_type not in ART_TYPES or ext not in rank:
+                                continue
+                            best = found.get(art_type)
+                            if best is None or rank[ext] > best[0]:
+                                found[art_type] = (rank[ext], entry.path)
+                except OSError:
+                    continue
+                if found:
+                    index[(platform.name, game.name)] = {t: p for t, (_, p) in found.items()}
+        return index
         
+    def iter_artwork_manifest(self, rom_catalog, index=None):
+        """Yield manifest entries one ROM at a time, resolved against the artwork index"""
+        if index is None:
+            index = self.index_artwork()
         for rom in rom_catalog.get('roms', []):
-            game_entry = {
+            artwork = dict.fromkeys(ART_TYPES)
+            artwork.update(index.get((rom['platform'], rom['name']), ()))
+            yield {
                 'name': rom['name'],
                 'platform': rom['platform'],
                 'rom_path': rom['path'],
-                'artwork': {
-                    'boxart': None,
-                    'title': None,
-                    'snap': None,
-                    'logo': None
-                }
+                'artwork': artwork
             }
             
-            # Check for existing local artwork
-            artwork_dir = self.output_dir / rom['platform'] / rom['name']
-            for art_type in ['boxart', 'title', 'snap', 'logo']:
-                for ext in ['.png', '.jpg', '.jpeg']:
-                    art_path = artwork_dir / f"{art_type}{ext}"
-                    if art_path.exists():
-                        game_entry['artwork'][art_type] = str(art_path)
-                        
+    def create_artwork_manifest(self, rom_catalog):
+        """Create artwork manifest from ROM catalog"""
+        manifest = {
+            'games': [],
+            'stats': {'total': 0, 'with_art': 0, 'missing': 0}
+        }
+        
+        for game_entry in self.iter_artwork_manifest(rom_catalog):
             manifest['games'].append(game_entry)
-            manifest['stats']['total'] += 1
-            
-            if any(game_entry['artwork'].values()):
-                manifest['stats']['with_art'] += 1
-            else:
-                manifest['stats']['missing'] += 1
-                
+            self._count_artwork(manifest['stats'], game_entry)
         return manifest
         
-    def generate_html_gallery(self, manifest, output_file):
-        """Generate HTML gallery of game artwork"""
-        html = """<!DOCTYPE html>
-<html>
-<head>
-    <title>Retro Game Gallery</title>
-    <style>
-        body { 
-            background: #1a1a2e; 
-            color: #00ff00; 
-            font-family: 'Courier New', monospace;
-            padding: 20px;
-        }
-        h1 { 
-            text-align: center; 
-            color: #00ff00;
-            text-shadow: 0 0 10px #00ff00;
-        }
-        .gallery { 
-            display: grid; 
-            grid-template-columns: repeat(auto-fill, minmax(200px, 1fr));
-            gap: 20px;
-        }
-        .game-card {
-            background: #16213e;
-            border: 2px solid #00ff00;
-            padding: 10px;
-            text-align: center;
-        }
-        .game-card img {
-            max-width: 100%;
-            height: 150px;
-            object-fit: contain;
-        }
-        .game-card .title {
-            margin-top: 10px;
-            font-size: 12px;
-        }
-        .game-card .platform {
-            color: #888;
-            font-size: 10px;
-        }
-        .placeholder {
-            background: #0a0a0a;
-            height: 150px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            border: 1px dashed #00ff00;
-        }
-    </style>
-</head>
-<body>
-    <h1>🎮 N01D TIME MACHINE - GAME GALLERY</h1>
-    <p style="text-align:center">
-        Total: """ + str(manifest['stats']['total']) + """ | 
-        With Art: """ + str(manifest['stats']['with_art']) + """ | 
-        Missing: """ + str(manifest['stats']['missing']) + """
-    </p>
-    <div class="gallery">
-"""
+    def write_artwork_manifest(self, rom_catalog, manifest_file):
+        """Stream the manifest to a JSON file entry by entry and return its stats"""
+        stats = {'total': 0, 'with_art': 0, 'missing': 0}
+        with open(manifest_file, 'w') as f:
+            f.write('{\n  "games": [')
+            for game_entry in self.iter_artwork_manifest(rom_catalog):
+                f.write(',\n    ' if stats['total'] else '\n    ')
+                f.write(json.dumps(game_entry))
+                self._count_artwork(stats, game_entry)
+            f.write('\n  ],\n  "stats": ')
+            f.write(json.dumps(stats))
+            f.write('\n}\n')
+        return stats
         
-        for game in manifest['games'][:100]:  # Limit to 100 for performance
-            boxart = game['artwork'].get('boxart')
-            if boxart:
-                img_html = f'<img src="{boxart}" alt="{game["name"]}">'
-            else:
-                img_html = f'<div class="placeholder">No Art</div>'
+    @staticmethod
+    def _count_artwork(stats, game_entry):
+        stats['total'] += 1
+        if any(game_entry['artwork'].values()):
+            stats['with_art'] += 1
+        else:
+            stats['missing'] += 1
+            
+    def thumbnail_path(self, source, size=THUMB_SIZE, fmt='webp'):
+        """Content-addressed location of the thumbnail for an artwork file"""
+        sha1 = self.image_info(source)['sha1']
+        return str(self.output_dir / THUMB_DIR / sha1[:2] /
+                   f"{sha1}-{size[0]}x{size[1]}.{fmt}")
+        
+    def build_thumbnails(self, sources, size=THUMB_SIZE, fmt='webp', jobs=None):
+        """Make thumbnails for the given artwork files on a process pool
+        
+        Returns {source: thumbnail path} for every source that has one.
+        Thumbnails that already exist for the same content are reused.
+        """
+        thumbs = {}
+        todo = []
+        for source in sources:
+            if source in thumbs:
+                continue
+            try:
+                dest = self.thumbnail_path(source, size, fmt)
+            except OSError:
+                continue
+            thumbs[source] = dest
+            if not os.path.exists(dest):
+                todo.append((source, dest))
+        self.cache.commit()
+        if not todo:
+            return thumbs
+            
+        jobs = jobs or os.cpu_count() or 1
+        pending = set()
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for source, dest in todo:
+                # Keep a bounded window so huge collections don't queue every job at once
+                if len(pending) >= jobs * 4:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._collect_thumbnails(done, thumbs)
+                future = pool.submit(make_thumbnail, source, dest, size, fmt)
+                future.source = source
+                pending.add(future)
+            self._collect_thumbnails(pending, thumbs)
+        return thumbs
+        
+    @staticmethod
+    def _collect_thumbnails(futures, thumbs):
+        for future in futures:
+            if future.result() is None:
+                del thumbs[future.source]
                 
-            html += f"""
-        <div class="game-card">
-            {img_html}
-            <div class="title">{game['name'][:30]}</div>
-            <div class="platform">{game['platform']}</div>
-        </div>
-"""
+    def generate_html_gallery(self, manifest, output_file, thumbnails=None,
+                              page_size=GALLERY_PAGE_SIZE):
+        """Generate a paginated HTML gallery of game artwork
         
-        html += """
-    </div>
-</body>
-</html>"""
+        manifest['games'] may be any iterable; games are written out in
+        page_size shards as they are read, so memory use doesn't grow with
+        the collection. The HTML page loads one shard at a time and only
+        fetches images as they scroll into view. thumbnails maps artwork
+        files to the thumbnails to show in their place.
+        
+        A search index is written alongside: each name and platform word
+        maps to the delta-encoded ids of its games, and the words are split
+        into search/<first two letters>.js shards so a query only loads the
+        shards for its own words.
+        """
+        thumbnails = thumbnails or {}
+        output_file = Path(output_file)
+        pages_dir = output_file.with_name(f"{output_file.stem}_pages")
+        pages_dir.mkdir(parents=True, exist_ok=True)
+        stats = {'total': 0, 'with_art': 0, 'missing': 0}
         
+        search_index = {}
+        page = 0
+        shard = None
+        for game in manifest['games']:
+            for token in set(search_tokens(f"{game['name']} {game['platform']}")):
+                postings = search_index.setdefault(token[:2], {})
+                if token not in postings:
+                    postings[token] = array('I')
+                postings[token].append(stats['total'])
+            if stats['total'] % page_size == 0:
+                if shard:
+                    shard.write(']);\n')
+                    shard.close()
+                page += 1
+                shard = open(pages_dir / f"page-{page:05d}.js", 'w', buffering=1 << 16)
+                shard.write(f'galleryPage({page}, [\n')
+            else:
+                shard.write(',\n')
+            boxart = game['artwork'].get('boxart')
+            boxart = thumbnails.get(boxart, boxart)
+            shard.write(json.dumps([game['name'], game['platform'], boxart]))
+            self._count_artwork(stats, game)
+        if shard:
+            shard.write(']);\n')
+            shard.close()
+        # Shards left over from a larger, earlier gallery
+        for stale in pages_dir.glob('page-*.js'):
+            if int(stale.stem[5:]) > page:
+                stale.unlink()
+                
+        self._write_search_shards(pages_dir / 'search', search_index)
+        with open(pages_dir / 'index.js', 'w') as f:
+            index = {'pages': page, 'page_size': page_size, 'stats': stats}
+            f.write(f"galleryIndex({json.dumps(index)});\n")
         with open(output_file, 'w') as f:
-            f.write(html)
+            f.write(GALLERY_HTML.replace('__PAGES__', pages_dir.name))
         return output_file
-
+        
+    @staticmethod
+    def _write_search_shards(search_dir, search_index):
+        search_dir.mkdir(exist_ok=True)
+        for key, postings in search_index.items():
+            encoded = {}
+            for token, ids in postings.items():
+                encoded[token] = [ids[0]] + [b - a for a, b in zip(ids, ids[1:])]
+            with open(search_dir / f"{key}.js", 'w') as f:
+                f.write(f"gallerySearchShard({json.dumps(key)}, "
+                        f"{json.dumps(encoded, separators=(',', ':'))});\n")
+        for stale in search_dir.glob('*.js'):
+            if stale.stem not in search_index:
+                stale.unlink()
 
 def main():
     print(BANNER)
@@ -234,7 +1212,7 @@ def main():
     parser = argparse.ArgumentParser(description="Retro Game Artwork Manager")
     parser.add_argument("-o", "--output", default="./artwork",
                        help="Output directory for artwork")
-    parser.add_argument("--catalog", help="ROM catalog JSON file")
+    parser.add_argument("--catalog", help="ROM catalog (JSON, NDJSON or SQLite --db file)")
     parser.add_argument("--generate", nargs=2, metavar=('GAME', 'PLATFORM'),
                        help="Generate placeholder art for game")
     parser.add_argument("--manifest", action="store_true",
@@ -243,10 +1221,38 @@ def main():
                        help="Generate HTML gallery")
     parser.add_argument("--search", nargs=2, metavar=('GAME', 'PLATFORM'),
                        help="Search for game artwork URLs")
+    parser.add_argument("--match", action="store_true",
+                       help="Fuzzy-match names against the server's known thumbnails")
+    parser.add_argument("--names", metavar="FILE",
+                       help="Known thumbnail names for --match, one per line, "
+                            "instead of the server listing")
+    parser.add_argument("--download", action="store_true",
+                       help="Download missing artwork for the catalog (resumable)")
+    parser.add_argument("--base-url", default=LIBRETRO_BASE_URL,
+                       help="Thumbnail server (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=8,
+                       help="Concurrent downloads (default: %(default)s)")
+    parser.add_argument("--rate", type=float, default=10.0,
+                       help="Requests per second per host (default: %(default)s)")
+    parser.add_argument("--no-thumbnails", action="store_true",
+                       help="Link full-size artwork from the gallery instead of thumbnails")
+    parser.add_argument("--thumb-format", choices=sorted(THUMB_FORMATS), default='webp',
+                       help="Gallery thumbnail format (default: %(default)s)")
+    parser.add_argument("--cache-size", type=int, default=CACHE_BUDGET // (1024 * 1024),
+                       metavar="MB", help="Lookup cache budget (default: %(default)s MB)")
+    parser.add_argument("--refresh", action="store_true",
+                       help="Revalidate already downloaded artwork with ETag/If-Modified-Since")
     
     args = parser.parse_args()
     
-    scraper = ArtworkScraper(args.output)
+    cache = LookupCache(CACHE_FILE, args.cache_size * 1024 * 1024)
+    scraper = ArtworkScraper(args.output, args.base_url, cache)
+    if args.match or args.names:
+        names = None
+        if args.names:
+            with open(args.names) as f:
+                names = [line.strip() for line in f if line.strip()]
+        scraper.enable_matching(names)
     
     if args.generate:
         game, platform = args.generate
@@ -265,34 +1271,63 @@ def main():
         print(f"[*] Searching artwork for: {game} ({platform})")
         
         result = scraper.search_libretro_thumbnails(game, platform)
+        match = result.get('match')
+        if match and match['name']:
+            print(f"[✓] Matched: {match['name']}")
+        elif match:
+            print(f"[✗] No confident match")
+            for score, candidate in match['candidates']:
+                print(f"  {score:.2f}  {candidate}")
         print(f"\n[LibRetro Thumbnails]")
         for art_type, path in result['paths'].items():
             url = result['url_template'].replace('{type}', path.split('/')[0])
             print(f"  {art_type}: {url}")
             
+    if args.catalog and args.download:
+        print(f"[*] Loading catalog: {args.catalog}")
+        downloader = ArtworkDownloader(scraper, args.workers, args.rate)
+        try:
+            queued = downloader.enqueue_catalog(load_catalog(args.catalog),
+                                                scraper.index_artwork())
+            print(f"[*] Queued {queued} new artwork files")
+            counts = downloader.run(args.refresh)
+        finally:
+            downloader.close()
+        print(f"\n[DOWNLOAD]")
+        for outcome, count in counts.items():
+            print(f"  {outcome.capitalize():11} {count}")
+            
     if args.catalog and args.manifest:
         print(f"[*] Loading catalog: {args.catalog}")
-        with open(args.catalog) as f:
-            catalog = json.load(f)
+        catalog = load_catalog(args.catalog)
             
-        manifest = scraper.create_artwork_manifest(catalog)
-        
         manifest_file = Path(args.output) / "manifest.json"
-        with open(manifest_file, 'w') as f:
-            json.dump(manifest, f, indent=2)
+        stats = scraper.write_artwork_manifest(catalog, manifest_file)
         print(f"[*] Manifest saved: {manifest_file}")
         
         print(f"\n[STATS]")
-        print(f"  Total Games: {manifest['stats']['total']}")
-        print(f"  With Artwork: {manifest['stats']['with_art']}")
-        print(f"  Missing: {manifest['stats']['missing']}")
+        print(f"  Total Games: {stats['total']}")
+        print(f"  With Artwork: {stats['with_art']}")
+        print(f"  Missing: {stats['missing']}")
         
         if args.gallery:
-            gallery_file = scraper.generate_html_gallery(manifest, args.gallery)
+            manifest = {'games': iter_manifest_games(manifest_file)}
+            thumbnails = None
+            if not args.no_thumbnails:
+                if PIL_AVAILABLE:
+                    boxarts = (g['artwork']['boxart'] for g in iter_manifest_games(manifest_file)
+                               if g['artwork'].get('boxart'))
+                    thumbnails = scraper.build_thumbnails(boxarts, fmt=args.thumb_format)
+                    print(f"[*] Thumbnails: {len(thumbnails)} in {Path(args.output) / THUMB_DIR}")
+                else:
+                    print("[*] Pillow not installed; gallery links full-size artwork")
+            gallery_file = scraper.generate_html_gallery(manifest, args.gallery, thumbnails)
             print(f"[*] Gallery saved: {gallery_file}")
             
-    if not any([args.generate, args.search, args.manifest]):
-        print("[*] Use --generate, --search, or --manifest")
+    cache.close()
+    
+    if not any([args.generate, args.search, args.manifest, args.download]):
+        print("[*] Use --generate, --search, --download, or --manifest")
         print("[*] Example: retro-artwork.py --generate 'Super Mario Bros' nes")
 
 
@@ -7,12 +7,38 @@ Organize, verify, and catalog your ROM collection.
 
 import os
 import sys
+import io
 import json
+import zlib
+import zipfile
+import itertools
+import sqlite3
 import hashlib
+import errno
+import pickle
+import xml.etree.ElementTree as ET
+from array import array
+import shutil
+import fnmatch
 import argparse
+import threading
+import select
+import struct
+import time
+import stat as stat_module
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
+try:
+    import libarchive
+    from libarchive.exception import ArchiveError
+    LIBARCHIVE_AVAILABLE = True
+except ImportError:
+    LIBARCHIVE_AVAILABLE = False
+    ArchiveError = OSError
+
 BANNER = """
 ██████╗  ██████╗ ███╗   ███╗    ███╗   ███╗ █████╗ ███╗   ██╗ █████╗  ██████╗ ███████╗██████╗ 
 ██╔══██╗██╔═══██╗████╗ ████║    ████╗ ████║██╔══██╗████╗  ██║██╔══██╗██╔════╝ ██╔════╝██╔══██╗
@@ -42,146 +68,2066 @@ PLATFORMS = {
     'zxspectrum': ['.tap', '.tzx', '.z80', '.sna'],
     'arcade': ['.zip'],  # MAME ROMs
     'psx': ['.bin', '.iso', '.img', '.cue'],
-    'pce': ['.pce', '.sgx']  # PC Engine/TurboGrafx
+    'pce': ['.pce', '.sgx'],  # PC Engine/TurboGrafx
+    'lynx': ['.lnx']
 }
 
+# Reverse index: extension -> candidate platforms, in PLATFORMS order
+EXTENSION_INDEX = {}
+for _platform, _extensions in PLATFORMS.items():
+    for _ext in _extensions:
+        EXTENSION_INDEX.setdefault(_ext, []).append(_platform)
+EXTENSION_INDEX = {ext: tuple(platforms) for ext, platforms in EXTENSION_INDEX.items()}
+
+# Every extension any platform claims; the walker rejects everything else by name
+ROM_EXTENSIONS = frozenset(EXTENSION_INDEX)
+
+# Bytes read from the start of a file to tell shared extensions apart
+SNIFF_SIZE = 4096
+
+CD_SYNC_PATTERN = b'\x00' + b'\xff' * 10 + b'\x00'
+ATARI2600_SIZES = {2048, 4096, 6144, 8192, 10240, 12288, 16384, 32768, 65536}
+
+
+def _sniff_psx(head, size):
+    # Raw 2352-byte CD sectors start with a sync pattern; no cartridge is this big
+    return head.startswith(CD_SYNC_PATTERN) or size > 8 * 1024 * 1024
+
+
+def _sniff_genesis(head, size):
+    # "SEGA" at 0x100 in plain dumps, 0xAA 0xBB marker in SMD copier headers
+    return b'SEGA' in head[0x100:0x110] or head[8:10] == b'\xaa\xbb'
+
+
+def _sniff_atari2600(head, size):
+    return size in ATARI2600_SIZES
+
+
+# Checked in order; magic-byte tests come before size heuristics
+PLATFORM_SNIFFERS = [
+    ('psx', _sniff_psx),
+    ('genesis', _sniff_genesis),
+    ('atari2600', _sniff_atari2600),
+]
+
+
+def disambiguate_platform(filepath, candidates, size=None):
+    """Pick among candidate platforms using the first SNIFF_SIZE bytes and file size"""
+    try:
+        if size is None:
+            size = os.stat(filepath).st_size
+        with open(filepath, 'rb') as f:
+            head = f.read(SNIFF_SIZE)
+    except OSError:
+        return candidates[0]
+        
+    for platform, sniff in PLATFORM_SNIFFERS:
+        if platform in candidates and sniff(head, size):
+            return platform
+            
+    probe = probe_rom(filepath, size)
+    if probe and probe['platform'] in candidates:
+        return probe['platform']
+    return candidates[0]
+
+# Enough of the file start to cover every header below, including a SNES
+# HiROM header behind a 512-byte copier header; larger offsets are seeked to
+PROBE_HEAD_SIZE = 0x10200
+
+GAMEBOY_LOGO = bytes.fromhex(
+    'ceed6666cc0d000b03730083000c000d0008111f8889000e'
+    'dccc6ee6ddddd999bbbb67636e0eecccdddc999fbbb9333e')
+D64_SIZES = {174848: (), 175531: ('error-info',), 196608: ('40-track',),
+             197376: ('40-track', 'error-info')}
+D64_BAM_OFFSET = 0x16500
+ADF_SIZES = {901120: (), 1802240: ('hd',)}
+
+
+def _probe_result(platform, header_size=0, title=None, quirks=()):
+    return {'platform': platform, 'title': title,
+            'header_size': header_size, 'quirks': list(quirks)}
+
+
+def _read_at(f, head, offset, length):
+    """Serve reads from the already-read head, seeking only past its end"""
+    if offset + length <= len(head):
+        return head[offset:offset + length]
+    f.seek(offset)
+    return f.read(length)
+
+
+def _clean_title(raw, pad=b'\x00'):
+    text = raw.split(pad, 1)[0].decode('latin-1')
+    text = ''.join(c if ' ' <= c <= '~' else ' ' for c in text)
+    return ' '.join(text.split()) or None
+
+
+def _probe_ines(f, head, size):
+    if len(head) < 16 or head[:4] != b'NES\x1a':
+        return None
+    flags6, flags7 = head[6], head[7]
+    nes2 = (flags7 & 0x0C) == 0x08
+    mapper = (flags6 >> 4) | (flags7 & 0xF0)
+    if nes2:
+        mapper |= (head[8] & 0x0F) << 8
+    quirks = ['nes2.0' if nes2 else 'ines', f'mapper-{mapper}']
+    if flags6 & 0x04:
+        quirks.append('trainer')
+    return _probe_result('nes', 16, None, quirks)
+
+
+def _probe_atari7800(f, head, size):
+    if head[1:10] != b'ATARI7800':
+        return None
+    return _probe_result('atari7800', 128, _clean_title(head[0x11:0x31]))
+
+
+def _probe_lynx(f, head, size):
+    if head[:4] != b'LYNX':
+        return None
+    return _probe_result('lynx', 64, _clean_title(head[0x0A:0x2A]))
+
+
+def _probe_gameboy(f, head, size):
+    if len(head) < 0x150 or head[0x104:0x134] != GAMEBOY_LOGO:
+        return None
+    cgb = head[0x143]
+    quirks = []
+    if cgb & 0x80:
+        quirks.append('cgb-only' if cgb == 0xC0 else 'cgb')
+    if head[0x146] == 0x03:
+        quirks.append('sgb')
+    title = head[0x134:0x143 if cgb & 0x80 else 0x144]
+    return _probe_result('gameboy', 0, _clean_title(title), quirks)
+
+
+def _probe_genesis(f, head, size):
+    if size % 16384 == 512 and head[8:10] == b'\xaa\xbb':
+        # Interleaved SMD dump: the header text is scrambled until deinterleaved
+        return _probe_result('genesis', 512, None, ['copier-header', 'smd-interleaved'])
+    for base in (0, 512):
+        if b'SEGA' in head[base + 0x100:base + 0x110]:
+            title = (_clean_title(head[base + 0x150:base + 0x180]) or
+                     _clean_title(head[base + 0x120:base + 0x150]))
+            quirks = ['copier-header'] if base else []
+            return _probe_result('genesis', base, title, quirks)
+    return None
+
+
+def _snes_header_score(header, hirom):
+    if len(header) < 32:
+        return 0
+    score = 0
+    complement = int.from_bytes(header[0x1C:0x1E], 'little')
+    checksum = int.from_bytes(header[0x1E:0x20], 'little')
+    if complement ^ checksum == 0xFFFF:
+        score += 4
+    map_mode = header[0x15]
+    if map_mode & 0xE0 == 0x20:
+        score += 1
+        if map_mode & 0x01 == hirom:
+            score += 2
+    if all(0x20 <= b < 0x7F for b in header[:21]):
+        score += 2
+    if 0x07 <= header[0x17] <= 0x0D:
+        score += 1
+    return score
+
+
+def _probe_snes(f, head, size):
+    base = 512 if size % 1024 == 512 else 0
+    best = None
+    for hirom, offset in ((0, 0x7FC0), (1, 0xFFC0)):
+        header = _read_at(f, head, base + offset, 32)
+        score = _snes_header_score(header, hirom)
+        if score >= 5 and (best is None or score > best[0]):
+            best = (score, hirom, header)
+    if best is None:
+        return None
+    _, hirom, header = best
+    quirks = ['hirom' if hirom else 'lorom']
+    if base:
+        quirks.insert(0, 'copier-header')
+    return _probe_result('snes', base, _clean_title(header[:21]), quirks)
+
+
+def _probe_d64(f, head, size):
+    if size not in D64_SIZES:
+        return None
+    bam = _read_at(f, head, D64_BAM_OFFSET, 0xA4)
+    if len(bam) < 0xA4 or bam[0] != 18 or bam[2] != 0x41:
+        return None
+    return _probe_result('c64', 0, _clean_title(bam[0x90:0xA0], b'\xa0'),
+                         D64_SIZES[size])
+
+
+def _probe_adf(f, head, size):
+    if size not in ADF_SIZES:
+        return None
+    quirks = list(ADF_SIZES[size])
+    bootblock = _read_at(f, head, 0, 1024)
+    if len(bootblock) < 1024:
+        return None
+    if bootblock[:3] == b'DOS':
+        quirks.append('ffs' if bootblock[3] & 0x01 else 'ofs')
+        total = 0
+        for i in range(0, 1024, 4):
+            total += int.from_bytes(bootblock[i:i + 4], 'big')
+            if total > 0xFFFFFFFF:
+                total = (total & 0xFFFFFFFF) + 1
+        if total == 0xFFFFFFFF:
+            quirks.append('bootable')
+    else:
+        quirks.append('ndos')
+        
+    # Root block sits in the middle of the disk and carries the volume name
+    title = None
+    root = _read_at(f, head, (size // 512 // 2) * 512, 512)
+    if (len(root) == 512 and int.from_bytes(root[:4], 'big') == 2 and
+            int.from_bytes(root[508:512], 'big') == 1):
+        length = min(root[432], 30)
+        title = _clean_title(root[433:433 + length])
+    return _probe_result('amiga', 0, title, quirks)
+
+
+# Tried in order: fixed magic first, then scored and size-keyed layouts
+PROBES = [
+    _probe_ines,
+    _probe_atari7800,
+    _probe_lynx,
+    _probe_gameboy,
+    _probe_genesis,
+    _probe_snes,
+    _probe_d64,
+    _probe_adf,
+]
+
+
+def probe_stream(f, size):
+    """Identify a ROM from its headers, reading only a few known offsets
+    
+    Returns a dict with platform, internal title, header_size (bytes of
+    copier/emulator header in front of the payload) and quirks, or None.
+    Truncated files, whose headers stop short of the offsets a probe reads,
+    are not identified by that probe.
+    """
+    head = f.read(PROBE_HEAD_SIZE)
+    if not head:
+        return None
+    for probe in PROBES:
+        try:
+            result = probe(f, head, size)
+        except IndexError:
+            continue
+        if result:
+            return result
+    return None
+
+
+def probe_rom(filepath, size=None):
+    """Open a file and run probe_stream on it"""
+    try:
+        if size is None:
+            size = os.stat(filepath).st_size
+        with open(filepath, 'rb') as f:
+            return probe_stream(f, size)
+    except OSError:
+        return None
+
+# Persistent state lives alongside the Time Machine config
+CONFIG_DIR = Path.home() / ".timemachine"
+SCAN_CACHE_FILE = CONFIG_DIR / "cache" / "scan.db"
+DEDUPE_JOURNAL_FILE = CONFIG_DIR / "dedupe-journal.ndjson"
+CATALOG_DB_FILE = CONFIG_DIR / "catalog.db"
+DAT_CACHE_DIR = CONFIG_DIR / "cache" / "dat"
+
+# linux/fs.h: _IOW(0x94, 9, int), clone all extents of one file into another
+FICLONE = 0x40049409
+
+# linux/inotify.h event bits used by the watch mode
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+# Seconds a file must stay quiet before it is rehashed, and the polling period
+WATCH_DEBOUNCE = 2.0
+WATCH_POLL_INTERVAL = 5.0
+
+# Read size for the streaming hasher; memory use stays at one chunk per file
+HASH_CHUNK_SIZE = 1024 * 1024
+
+class MultiHasher:
+    """Feed MD5, SHA1 and CRC32 from a single pass over the data"""
+    
+    def __init__(self):
+        self.md5 = hashlib.md5()
+        self.sha1 = hashlib.sha1()
+        self.crc32 = 0
+        
+    def update(self, data):
+        self.md5.update(data)
+        self.sha1.update(data)
+        self.crc32 = zlib.crc32(data, self.crc32)
+        
+    def hexdigests(self):
+        return {
+            'md5': self.md5.hexdigest(),
+            'sha1': self.sha1.hexdigest(),
+            'crc32': format(self.crc32, '08x')
+        }
+
+
+def hash_chunks(chunks, header_size=0):
+    """Hash an iterable of byte chunks in one pass
+    
+    Alongside the raw digests, payload_md5/payload_sha1/payload_crc32 cover
+    the data after the first header_size bytes, fed from memoryview slices
+    of the same chunks. Without a header they equal the raw digests.
+    """
+    hasher = MultiHasher()
+    payload = MultiHasher() if header_size else hasher
+    pos = 0
+    for chunk in chunks:
+        n = len(chunk)
+        hasher.update(chunk)
+        if payload is not hasher and pos + n > header_size:
+            payload.update(memoryview(chunk)[max(header_size - pos, 0):])
+        pos += n
+        
+    hashes = hasher.hexdigests()
+    for key, value in payload.hexdigests().items():
+        hashes[f'payload_{key}'] = value
+    return hashes
+
+
+def read_chunks(stream, chunk_size=HASH_CHUNK_SIZE):
+    """Yield views of a single reused buffer filled from stream"""
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    while True:
+        n = stream.readinto(buf)
+        if not n:
+            break
+        yield view[:n]
+
+
+def hash_stream(stream, chunk_size=HASH_CHUNK_SIZE, header_size=0):
+    """Hash a binary stream chunk by chunk into a reused buffer"""
+    return hash_chunks(read_chunks(stream, chunk_size), header_size)
+
+
+def hash_rom(f, size):
+    """Probe an open ROM for headers, then hash it raw and headerless in one pass"""
+    probe = probe_stream(f, size) or {}
+    f.seek(0)
+    return probe, hash_stream(f, header_size=probe.get('header_size', 0))
+
+
+# Bytes hashed from each end of a file before committing to a full hash
+DEDUPE_SAMPLE_SIZE = 64 * 1024
+
+
+def sample_hash(filepath, size, sample_size=DEDUPE_SAMPLE_SIZE):
+    """MD5 of the first and last sample_size bytes; the whole file if it is small
+    
+    Returns (digest, bytes_read, complete) where complete means the digest
+    covered the entire file and is its real MD5.
+    """
+    md5 = hashlib.md5()
+    with open(filepath, 'rb') as f:
+        if size <= 2 * sample_size:
+            data = f.read()
+            md5.update(data)
+            return md5.hexdigest(), len(data), True
+        md5.update(f.read(sample_size))
+        f.seek(size - sample_size)
+        md5.update(f.read(sample_size))
+    return md5.hexdigest(), 2 * sample_size, False
+
+
+def full_md5(filepath):
+    """Streaming MD5 of a whole file"""
+    md5 = hashlib.md5()
+    buf = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(filepath, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            md5.update(view[:n])
+    return md5.hexdigest()
+
+
+# Archive members up to this size are buffered whole so every probe can seek;
+# larger ones are probed from their first PROBE_HEAD_SIZE bytes only
+MEMBER_BUFFER_LIMIT = 4 * 1024 * 1024
+ARCHIVE_EXTENSIONS = frozenset({'.zip', '.7z', '.lha', '.lzh'})
+
+# Platform placeholder for archives whose members are cataloged individually
+ARCHIVE = 'archive'
+
+# What a damaged archive can raise while its members are listed or inflated
+ARCHIVE_ERRORS = (zipfile.BadZipFile, zlib.error, EOFError, NotImplementedError,
+                  OSError, RuntimeError, ArchiveError)
+
+
+def hash_member(blocks, size):
+    """Probe and hash an archive member delivered as a stream of blocks"""
+    want = size if size <= MEMBER_BUFFER_LIMIT else PROBE_HEAD_SIZE
+    blocks = iter(blocks)
+    head = bytearray()
+    for block in blocks:
+        head += block
+        if len(head) >= want:
+            break
+    probe = probe_stream(io.BytesIO(head), size) or {}
+    sniff_head = bytes(head[:SNIFF_SIZE])
+    hashes = hash_chunks(itertools.chain([head], blocks), probe.get('header_size', 0))
+    return probe, hashes, sniff_head
+
+
+def iter_archive(filepath):
+    """Yield (member name, size, stored CRC32 or None, block iterator factory)
+    
+    Zip files use the standard library and expose the central-directory
+    CRC; 7z and LHA need the optional libarchive-c package. Members are
+    always streamed, never extracted to disk.
+    """
+    if filepath.suffix.lower() == '.zip':
+        with zipfile.ZipFile(filepath) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                def blocks(info=info):
+                    with zf.open(info) as f:
+                        yield from iter(lambda: f.read(HASH_CHUNK_SIZE), b'')
+                yield info.filename, info.file_size, info.CRC, blocks
+        return
+        
+    if not LIBARCHIVE_AVAILABLE:
+        return
+    with libarchive.file_reader(str(filepath)) as archive:
+        for entry in archive:
+            if not entry.isfile:
+                continue
+            # libarchive entries are only readable while current, so hand out
+            # a one-shot iterator over this entry's blocks
+            blocks = entry.get_blocks()
+            yield entry.pathname, entry.size, None, lambda blocks=blocks: blocks
+
+
+def member_platform(name, size, head=b''):
+    """Platform for an archive member, from its name and optionally its first bytes"""
+    ext = os.path.splitext(name)[1].lower()
+    if ext in ARCHIVE_EXTENSIONS:
+        return None
+    candidates = EXTENSION_INDEX.get(ext)
+    if not candidates:
+        return None
+    if len(candidates) == 1:
+        return candidates[0]
+    for platform, sniff in PLATFORM_SNIFFERS:
+        if platform in candidates and sniff(head, size):
+            return platform
+    return candidates[0]
+
+
+def analyze_archive(filepath, stat, crc_only=False):
+    """Catalog the ROMs inside an archive, hashing each member from its stream
+    
+    With crc_only, zip members are recorded from the central directory
+    alone (CRC32 and size, nothing decompressed). A zip with no recognised
+    ROM members is a MAME set and is cataloged as one arcade file. A damaged
+    member is skipped; if the archive can't be read any further, the members
+    hashed so far are kept.
+    """
+    records = []
+    try:
+        for name, size, crc, blocks in iter_archive(filepath):
+            if crc_only and crc is not None:
+                platform = member_platform(name, size)
+                if platform:
+                    records.append(ROMRecord.from_digests(
+                        str(filepath), platform, size, stat.st_mtime, None, None, crc,
+                        member=name))
+                continue
+            if not member_platform(name, size):
+                continue
+            try:
+                probe, hashes, head = hash_member(blocks(), size)
+            except ARCHIVE_ERRORS:
+                continue
+            candidates = EXTENSION_INDEX[os.path.splitext(name)[1].lower()]
+            platform = probe.get('platform')
+            if platform not in candidates:
+                platform = member_platform(name, size, head)
+            records.append(ROMRecord(str(filepath), platform, size, stat.st_mtime, hashes,
+                                     probe.get('title'), probe.get('header_size', 0),
+                                     probe.get('quirks', ()), member=name))
+    except ARCHIVE_ERRORS:
+        pass
+        
+    if not records and filepath.suffix.lower() == '.zip':
+        records.append(analyze_rom(filepath, 'arcade', stat))
+    return records
+
+
+def analyze_path(filepath, platform, stat, crc_only=False):
+    """Worker entry point: (path, records) for a plain ROM or an archive"""
+    if platform == ARCHIVE:
+        return str(filepath), analyze_archive(filepath, stat, crc_only)
+    return str(filepath), [analyze_rom(filepath, platform, stat)]
+
+
+def files_identical(path_a, path_b, chunk_size=HASH_CHUNK_SIZE):
+    """Byte-for-byte comparison of two files, reading both in step"""
+    with open(path_a, 'rb', buffering=0) as fa, open(path_b, 'rb', buffering=0) as fb:
+        if os.fstat(fa.fileno()).st_size != os.fstat(fb.fileno()).st_size:
+            return False
+        buf_a = bytearray(chunk_size)
+        buf_b = bytearray(chunk_size)
+        while True:
+            n = fa.readinto(buf_a)
+            if n != fb.readinto(buf_b):
+                return False
+            if not n:
+                return True
+            if memoryview(buf_a)[:n] != memoryview(buf_b)[:n]:
+                return False
+
+
+def reflink(src, dst):
+    """Create dst sharing src's extents via the FICLONE ioctl (btrfs, XFS, ...)"""
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def _replace_with_link(original, duplicate, mode):
+    """Atomically swap duplicate for a hardlink or reflink of original"""
+    tmp = os.path.join(os.path.dirname(duplicate),
+                       f".{os.path.basename(duplicate)}.dedupe-tmp")
+    try:
+        if mode == 'reflink':
+            reflink(original, tmp)
+            shutil.copystat(duplicate, tmp)
+        else:
+            os.link(original, tmp)
+        os.replace(tmp, duplicate)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def copy_file_fast(src, dst):
+    """Copy file data in the kernel with copy_file_range, else sendfile, else read/write"""
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+        size = os.fstat(in_fd).st_size
+        copied = 0
+        methods = [m for m in ('copy_file_range', 'sendfile') if hasattr(os, m)]
+        while copied < size and methods:
+            try:
+                if methods[0] == 'copy_file_range':
+                    n = os.copy_file_range(in_fd, out_fd, size - copied, copied, copied)
+                else:
+                    os.lseek(out_fd, copied, os.SEEK_SET)
+                    n = os.sendfile(out_fd, in_fd, copied, size - copied)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                                   errno.EOPNOTSUPP, errno.ENOTSUP):
+                    raise
+                methods.pop(0)
+                continue
+            if n == 0:
+                break
+            copied += n
+        if copied < size:
+            fsrc.seek(copied)
+            fdst.seek(copied)
+            shutil.copyfileobj(fsrc, fdst, HASH_CHUNK_SIZE)
+        fdst.flush()
+        os.fsync(out_fd)
+
+
+def _device_of(path):
+    """st_dev of path, or of its nearest existing parent"""
+    path = os.path.abspath(path)
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except FileNotFoundError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                raise
+            path = parent
+
+
+def _unique_target(target, taken):
+    """target, or 'name (2).ext', 'name (3).ext', ... if it is planned or on disk"""
+    stem, ext = os.path.splitext(target)
+    n = 1
+    candidate = target
+    while candidate in taken or os.path.lexists(candidate):
+        n += 1
+        candidate = f"{stem} ({n}){ext}"
+    return candidate
+
+
+def walk_files(root, extensions, recursive=True, exclude=()):
+    """Yield DirEntry objects for files under root whose extension is wanted
+    
+    Built on os.scandir so the d_type from readdir answers is_dir/is_file
+    without extra syscalls, and files are rejected by name before anything
+    else is allocated. Directories whose name matches an exclude pattern are
+    pruned, and each directory is entered at most once so symlink loops
+    terminate.
+    """
+    visited = set()
+    stack = [os.fspath(root)]
+    while stack:
+        directory = stack.pop()
+        try:
+            dir_stat = os.stat(directory)
+        except OSError:
+            continue
+        dir_key = (dir_stat.st_dev, dir_stat.st_ino)
+        if dir_key in visited:
+            continue
+        visited.add(dir_key)
+        
+        subdirs = []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    name = entry.name
+                    dot = name.rfind('.')
+                    if dot > 0 and name[dot:].lower() in extensions:
+                        try:
+                            if entry.is_file():
+                                yield entry
+                                continue
+                        except OSError:
+                            continue
+                    if recursive:
+                        try:
+                            is_dir = entry.is_dir()
+                        except OSError:
+                            continue
+                        if is_dir and not any(fnmatch.fnmatch(name, pat) for pat in exclude):
+                            subdirs.append(entry.path)
+        except OSError:
+            continue
+        # Reversed so subdirectories are visited in scandir order
+        stack.extend(reversed(subdirs))
+
+
+def _watch_dirs(root, recursive=True, exclude=()):
+    """Yield root and, if recursive, every directory below it that isn't excluded"""
+    visited = set()
+    stack = [os.fspath(root)]
+    while stack:
+        directory = stack.pop()
+        try:
+            dir_stat = os.stat(directory)
+        except OSError:
+            continue
+        if (dir_stat.st_dev, dir_stat.st_ino) in visited:
+            continue
+        visited.add((dir_stat.st_dev, dir_stat.st_ino))
+        yield directory
+        if not recursive:
+            continue
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir() and not any(fnmatch.fnmatch(entry.name, pat)
+                                                      for pat in exclude):
+                            stack.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+
+class InotifyWatcher:
+    """Report changed paths under a tree using Linux inotify through ctypes
+    
+    read() returns (path, kind) pairs: kind is 'file' for a file that was
+    written, created, moved or deleted, 'dir' for a directory that appeared
+    or went away (its contents must be rechecked), or 'overflow' when the
+    kernel queue overflowed and everything must be rechecked.
+    """
+    
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+            IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    
+    def __init__(self, root, recursive=True, exclude=()):
+        import ctypes
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            self._add_watch = libc.inotify_add_watch
+        except (OSError, AttributeError):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._ctypes = ctypes
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.recursive = recursive
+        self.exclude = tuple(exclude)
+        self.dirs = {}
+        try:
+            self.watch_tree(root)
+        except OSError:
+            os.close(self.fd)
+            raise
+            
+    def watch_tree(self, root):
+        """Watch root and its subdirectories; ENOSPC means max_user_watches was hit"""
+        for directory in _watch_dirs(root, self.recursive, self.exclude):
+            wd = self._add_watch(self.fd, os.fsencode(directory), self.MASK)
+            if wd < 0:
+                err = self._ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    raise OSError(err, "inotify watch limit reached "
+                                       "(fs.inotify.max_user_watches)")
+                continue
+            self.dirs[wd] = directory
+            
+    def read(self, timeout=None):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        changes = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                changes.append((None, 'overflow'))
+                continue
+            directory = self.dirs.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.dirs[wd]
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                changes.append((directory, 'dir'))
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if any(fnmatch.fnmatch(name, pat) for pat in self.exclude):
+                    continue
+                if mask & (IN_CREATE | IN_MOVED_TO) and self.recursive:
+                    self.watch_tree(path)
+                changes.append((path, 'dir'))
+            else:
+                changes.append((path, 'file'))
+        return changes
+        
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback watcher that diffs (size, mtime, inode) snapshots every interval"""
+    
+    def __init__(self, root, extensions, recursive=True, exclude=(),
+                 interval=WATCH_POLL_INTERVAL):
+        self.root = root
+        self.extensions = extensions
+        self.recursive = recursive
+        self.exclude = tuple(exclude)
+        self.interval = interval
+        self.snapshot = self._snapshot()
+        self.next_poll = time.monotonic() + interval
+        
+    def _snapshot(self):
+        snapshot = {}
+        for entry in walk_files(self.root, self.extensions, self.recursive, self.exclude):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            snapshot[entry.path] = (st.st_size, st.st_mtime_ns, st.st_ino)
+        return snapshot
+        
+    def read(self, timeout=None):
+        wait = self.next_poll - time.monotonic()
+        if timeout is not None and timeout < wait:
+            time.sleep(max(timeout, 0))
+            return []
+        time.sleep(max(wait, 0))
+        self.next_poll = time.monotonic() + self.interval
+        old, self.snapshot = self.snapshot, self._snapshot()
+        changed = [p for p, key in self.snapshot.items() if old.get(p) != key]
+        changed.extend(p for p in old if p not in self.snapshot)
+        return [(path, 'file') for path in changed]
+        
+    def close(self):
+        pass
+
+
+def open_watcher(root, extensions, recursive=True, exclude=(), poll_interval=WATCH_POLL_INTERVAL):
+    """An InotifyWatcher where the kernel supports it, else a PollingWatcher"""
+    try:
+        return InotifyWatcher(root, recursive, exclude)
+    except OSError:
+        return PollingWatcher(root, extensions, recursive, exclude, poll_interval)
+
+
+def human_size(size):
+    """Convert bytes to human readable"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class ROMRecord:
+    """Compact catalog entry
+    
+    Hashes are kept as raw digests, platform names and quirks are interned,
+    and name, filename, size_human, modified and the hex hashes are derived
+    on access. Item access (rom['md5']) mirrors the old dict records.
+    ROMs inside archives carry the member path; CRC-only archive audits
+    leave md5/sha1 as None.
+    """
+    
+    __slots__ = ('path', 'member', 'platform', 'size', 'mtime', 'md5_digest',
+                 'sha1_digest', 'crc32_value', 'payload_digests', 'title',
+                 'header_size', 'quirks')
+    
+    # Keys of the exported record, in export order
+    FIELDS = ('name', 'filename', 'path', 'member', 'platform', 'size', 'size_human',
+              'md5', 'sha1', 'crc32', 'payload_md5', 'payload_sha1', 'payload_crc32',
+              'title', 'header_size', 'quirks', 'modified')
+    
+    def __init__(self, path, platform, size, mtime, hashes, title=None,
+                 header_size=0, quirks=(), member=None):
+        self.path = path
+        self.member = member
+        self.platform = sys.intern(platform)
+        self.size = size
+        self.mtime = mtime
+        self.md5_digest = bytes.fromhex(hashes['md5']) if hashes.get('md5') else None
+        self.sha1_digest = bytes.fromhex(hashes['sha1']) if hashes.get('sha1') else None
+        self.crc32_value = int(hashes['crc32'], 16)
+        # Only headered ROMs pay for a second set of digests
+        if header_size and hashes.get('payload_md5', hashes['md5']) != hashes['md5']:
+            self.payload_digests = (bytes.fromhex(hashes['payload_md5']),
+                                    bytes.fromhex(hashes['payload_sha1']),
+                                    int(hashes['payload_crc32'], 16))
+        else:
+            self.payload_digests = None
+        self.title = title
+        self.header_size = header_size
+        self.quirks = tuple(sys.intern(q) for q in quirks)
+        
+    @classmethod
+    def from_digests(cls, path, platform, size, mtime, md5, sha1, crc32,
+                     payload_digests=None, title=None, header_size=0, quirks=(),
+                     member=None):
+        """Build a record straight from stored raw digests"""
+        rom = cls.__new__(cls)
+        rom.path = path
+        rom.member = member
+        rom.platform = sys.intern(platform)
+        rom.size = size
+        rom.mtime = mtime
+        rom.md5_digest = md5
+        rom.sha1_digest = sha1
+        rom.crc32_value = crc32
+        rom.payload_digests = payload_digests
+        rom.title = title
+        rom.header_size = header_size
+        rom.quirks = tuple(sys.intern(q) for q in quirks)
+        return rom
+        
+    @classmethod
+    def from_dict(cls, rom, mtime=None):
+        """Rebuild a record from its exported dict form"""
+        if mtime is None:
+            mtime = datetime.fromisoformat(rom['modified']).timestamp()
+        return cls(rom['path'], rom['platform'], rom['size'], mtime, rom,
+                   rom.get('title'), rom.get('header_size', 0), rom.get('quirks', ()),
+                   rom.get('member'))
+        
+    @property
+    def name(self):
+        return os.path.splitext(self.filename)[0]
+        
+    @property
+    def filename(self):
+        return os.path.basename(self.member or self.path)
+        
+    @property
+    def location(self):
+        """Path for display and reports; archive members read archive.zip#member"""
+        return f"{self.path}#{self.member}" if self.member else self.path
+        
+    @property
+    def size_human(self):
+        return human_size(self.size)
+        
+    @property
+    def modified(self):
+        return datetime.fromtimestamp(self.mtime).isoformat()
+        
+    @property
+    def md5(self):
+        return self.md5_digest.hex() if self.md5_digest else None
+        
+    @property
+    def sha1(self):
+        return self.sha1_digest.hex() if self.sha1_digest else None
+        
+    @property
+    def crc32(self):
+        return format(self.crc32_value, '08x')
+        
+    @property
+    def payload_md5_digest(self):
+        return self.payload_digests[0] if self.payload_digests else self.md5_digest
+        
+    @property
+    def payload_md5(self):
+        digest = self.payload_md5_digest
+        return digest.hex() if digest else None
+        
+    @property
+    def payload_sha1(self):
+        return self.payload_digests[1].hex() if self.payload_digests else self.sha1
+        
+    @property
+    def payload_crc32(self):
+        if self.payload_digests:
+            return format(self.payload_digests[2], '08x')
+        return self.crc32
+        
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        value = getattr(self, key)
+        return list(value) if key == 'quirks' else value
+        
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+            
+    def to_dict(self):
+        return {key: self[key] for key in self.FIELDS}
+        
+    def __repr__(self):
+        return f"ROMRecord({self.location!r}, {self.platform!r}, {self.size})"
+
+
+def analyze_rom(filepath, platform, stat=None):
+    """Analyze individual ROM file (module level so process pools can pickle it)"""
+    if stat is None:
+        stat = filepath.stat()
+    with open(filepath, 'rb', buffering=0) as f:
+        probe, hashes = hash_rom(f, stat.st_size)
+        
+    return ROMRecord(str(filepath), platform, stat.st_size, stat.st_mtime, hashes,
+                     probe.get('title'), probe.get('header_size', 0),
+                     probe.get('quirks', ()))
+
+
+def catalog_format(output_file):
+    """Pick the export format from the file extension"""
+    return 'ndjson' if str(output_file).lower().endswith(('.ndjson', '.jsonl')) else 'json'
+
+
+def resolved(value):
+    """Wrap an already-known result so ordered_map passes it straight through"""
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def ordered_map(func, items, jobs=1, use_processes=False):
+    """Map func over argument tuples on a worker pool, yielding results in input order
+    
+    Items that are already resolved futures skip the pool entirely.
+    """
+    if jobs <= 1:
+        for args in items:
+            yield args.result() if isinstance(args, Future) else func(*args)
+        return
+        
+    # Bounded window keeps memory flat while every worker stays busy
+    window = jobs * 4
+    executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor_cls(max_workers=jobs) as executor:
+        pending = deque()
+        for args in items:
+            if not isinstance(args, Future):
+                args = executor.submit(func, *args)
+            pending.append(args)
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class ScanCache:
+    """SQLite cache of analyzed ROMs keyed on path, size, mtime and inode"""
+    
+    # Bump when the ROM record layout changes so stale entries are dropped
+    VERSION = 4
+    # Bump when the table layout changes; the cache is rebuilt
+    SCHEMA_VERSION = 2
+    COMMIT_EVERY = 1000
+    
+    def __init__(self, db_file=SCAN_CACHE_FILE):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.db_file))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            self.db.execute("DROP TABLE IF EXISTS files")
+            self.db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER,
+            inode INTEGER, version INTEGER, archive INTEGER, info TEXT)""")
+        self.pending = 0
+        self.hits = 0
+        self.misses = 0
+        
+    @staticmethod
+    def _key(stat):
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+        
+    def lookup(self, path, stat, platforms=None, full_hashes=True, archive=False):
+        """Return the cached records for a file if it is unchanged, else None
+        
+        platforms lists the acceptable platforms for the file's extension, so
+        files with shared extensions are not re-sniffed when unchanged (None
+        accepts any, as for archives). With full_hashes, records left by a
+        CRC-only archive audit don't count as a hit. archive says whether the
+        file is being scanned as an archive; records from the other mode
+        (a zip cataloged whole versus member by member) don't count either.
+        """
+        row = self.db.execute(
+            "SELECT size, mtime_ns, inode, version, archive, info FROM files WHERE path = ?",
+            (path,)).fetchone()
+        if (row and tuple(row[:3]) == self._key(stat) and row[3] == self.VERSION and
+                bool(row[4]) == archive):
+            records = [ROMRecord.from_dict(rom, stat.st_mtime) for rom in json.loads(row[5])]
+            if ((platforms is None or all(r.platform in platforms for r in records)) and
+                    not (full_hashes and any(r.md5_digest is None for r in records))):
+                self.hits += 1
+                return records
+        self.misses += 1
+        return None
+        
+    def store(self, path, records, stat, archive=False):
+        """Record a file's freshly analyzed ROMs; writes are committed in batches"""
+        self.db.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (path, *self._key(stat), self.VERSION, archive,
+             json.dumps([rom.to_dict() for rom in records])))
+        self.pending += 1
+        if self.pending >= self.COMMIT_EVERY:
+            self.db.commit()
+            self.pending = 0
+            
+    def prune(self, root, seen):
+        """Drop entries under root that were not seen by the latest scan"""
+        prefix = os.path.join(str(root), '')
+        self.db.execute("CREATE TEMP TABLE IF NOT EXISTS seen (path TEXT PRIMARY KEY)")
+        self.db.execute("DELETE FROM seen")
+        self.db.executemany("INSERT OR IGNORE INTO seen VALUES (?)",
+                            ((p,) for p in seen))
+        cursor = self.db.execute(
+            "DELETE FROM files WHERE substr(path, 1, ?) = ? "
+            "AND path NOT IN (SELECT path FROM seen)",
+            (len(prefix), prefix))
+        self.db.commit()
+        return cursor.rowcount
+        
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+        
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+class CatalogDB:
+    """SQLite catalog with indexed hash, platform and name columns
+    
+    Scans stream records in through add(), which writes them in batched
+    transactions; queries return ROMRecord objects without loading the
+    rest of the collection.
+    """
+    
+    BATCH_SIZE = 5000
+    # 3: paths are absolute
+    SCHEMA_VERSION = 3
+    COLUMNS = ('path', 'member', 'name', 'platform', 'size', 'mtime', 'md5', 'sha1', 'crc32',
+               'payload_md5', 'payload_sha1', 'payload_crc32', 'title',
+               'header_size', 'quirks', 'scan_id')
+    
+    def __init__(self, db_file=CATALOG_DB_FILE):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.db_file))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        # The catalog is derived data: rebuild rather than migrate old layouts
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            self.db.execute("DROP TABLE IF EXISTS roms")
+            self.db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS roms (
+                path TEXT, member TEXT NOT NULL DEFAULT '',
+                name TEXT COLLATE NOCASE, platform TEXT,
+                size INTEGER, mtime REAL, md5 BLOB, sha1 BLOB, crc32 INTEGER,
+                payload_md5 BLOB, payload_sha1 BLOB, payload_crc32 INTEGER,
+                title TEXT, header_size INTEGER, quirks TEXT, scan_id INTEGER,
+                PRIMARY KEY (path, member));
+            CREATE INDEX IF NOT EXISTS roms_md5 ON roms (md5);
+            CREATE INDEX IF NOT EXISTS roms_sha1 ON roms (sha1);
+            CREATE INDEX IF NOT EXISTS roms_crc32 ON roms (crc32);
+            CREATE INDEX IF NOT EXISTS roms_payload_md5 ON roms (payload_md5);
+            CREATE INDEX IF NOT EXISTS roms_payload_sha1 ON roms (payload_sha1);
+            CREATE INDEX IF NOT EXISTS roms_payload_crc32 ON roms (payload_crc32);
+            CREATE INDEX IF NOT EXISTS roms_platform ON roms (platform, name);
+            CREATE INDEX IF NOT EXISTS roms_name ON roms (name);
+        """)
+        self.scan_id = None
+        self.batch = []
+        
+    def begin_scan(self):
+        """Start a scan generation; rows it doesn't touch can be pruned by finish_scan"""
+        row = self.db.execute("SELECT COALESCE(MAX(scan_id), 0) + 1 FROM roms").fetchone()
+        self.scan_id = row[0]
+        
+    def _row(self, rom):
+        payload = rom.payload_digests or (None, None, None)
+        return (rom.path, rom.member or '', rom.name, rom.platform, rom.size, rom.mtime,
+                rom.md5_digest, rom.sha1_digest, rom.crc32_value, *payload,
+                rom.title, rom.header_size, ','.join(rom.quirks), self.scan_id)
+        
+    def add(self, rom):
+        self.batch.append(self._row(rom))
+        if len(self.batch) >= self.BATCH_SIZE:
+            self.flush()
+            
+    def flush(self):
+        if self.batch:
+            with self.db:
+                self.db.executemany(
+                    f"INSERT OR REPLACE INTO roms VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                    self.batch)
+            self.batch = []
+            
+    def write(self, roms):
+        """Store a whole catalog's records"""
+        for rom in roms:
+            self.add(rom)
+        self.flush()
+        
+    def remove_paths(self, paths):
+        """Drop every row, archive members included, for the given file paths"""
+        self.flush()
+        with self.db:
+            self.db.executemany("DELETE FROM roms WHERE path = ?", ((p,) for p in paths))
+            
+    def finish_scan(self, root):
+        """Flush and drop rows under root that the current scan didn't see"""
+        self.flush()
+        prefix = os.path.join(os.path.abspath(root), '')
+        with self.db:
+            cursor = self.db.execute(
+                "DELETE FROM roms WHERE substr(path, 1, ?) = ? AND scan_id != ?",
+                (len(prefix), prefix, self.scan_id))
+        return cursor.rowcount
+        
+    def _query(self, where, params=()):
+        cursor = self.db.execute(
+            f"SELECT {', '.join(self.COLUMNS[:-1])} FROM roms WHERE {where}", params)
+        for (path, member, _, platform, size, mtime, md5, sha1, crc32, p_md5, p_sha1,
+             p_crc32, title, header_size, quirks) in cursor:
+            payload = (p_md5, p_sha1, p_crc32) if p_md5 is not None else None
+            yield ROMRecord.from_digests(path, platform, size, mtime, md5, sha1, crc32,
+                                         payload, title, header_size,
+                                         quirks.split(',') if quirks else (),
+                                         member or None)
+            
+    def find_by_hash(self, hash_hex):
+        """Look up ROMs by CRC32, MD5 or SHA1 (raw or headerless), chosen by length"""
+        hash_hex = hash_hex.strip().lower()
+        if len(hash_hex) == 8:
+            column, value = 'crc32', int(hash_hex, 16)
+        elif len(hash_hex) in (32, 40):
+            column = 'md5' if len(hash_hex) == 32 else 'sha1'
+            value = bytes.fromhex(hash_hex)
+        else:
+            raise ValueError(f"not a CRC32, MD5 or SHA1 hash: {hash_hex}")
+        return list(self._query(f"{column} = ? OR payload_{column} = ?", (value, value)))
+        
+    def find_by_platform(self, platform):
+        return list(self._query("platform = ? ORDER BY name", (platform,)))
+        
+    def find_by_name(self, pattern):
+        """Case-insensitive name match; a pattern without wildcards is a prefix"""
+        like = pattern.replace('*', '%').replace('?', '_')
+        if '%' not in like:
+            like += '%'
+        return list(self._query("name LIKE ? ORDER BY name", (like,)))
+        
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+class DatIndex:
+    """Hash-keyed index of a No-Intro / Redump / MAME XML DAT
+    
+    The XML is parsed with iterparse and each game element is cleared once
+    read, so even very large DATs never exist as a full tree. The finished
+    index is pickled under DAT_CACHE_DIR and reused until the DAT changes.
+    """
+    
+    VERSION = 1
+    GAME_TAGS = ('game', 'machine', 'software')
+    
+    def __init__(self):
+        self.name = None
+        # entries[i] = (game, rom name, size, crc32 int, md5 bytes, sha1 bytes)
+        self.entries = []
+        self.by_sha1 = {}
+        self.by_md5 = {}
+        self.by_crc_size = {}
+        self.by_name = {}
+        
+    def _add(self, game, rom):
+        size = rom.get('size')
+        size = int(size) if size and size.isdigit() else None
+        crc = rom.get('crc')
+        md5 = rom.get('md5')
+        sha1 = rom.get('sha1')
+        entry = (game, rom.get('name'), size,
+                 int(crc, 16) if crc else None,
+                 bytes.fromhex(md5) if md5 else None,
+                 bytes.fromhex(sha1) if sha1 else None)
+        i = len(self.entries)
+        self.entries.append(entry)
+        if entry[5]:
+            self.by_sha1.setdefault(entry[5], i)
+        if entry[4]:
+            self.by_md5.setdefault(entry[4], i)
+        if entry[3] is not None:
+            self.by_crc_size.setdefault((entry[3], size), i)
+        if entry[1]:
+            self.by_name.setdefault(entry[1].lower(), i)
+            
+    @classmethod
+    def parse(cls, dat_file):
+        """Build an index by streaming through the DAT"""
+        index = cls()
+        game = None
+        root = None
+        for event, elem in ET.iterparse(str(dat_file), events=('start', 'end')):
+            if root is None:
+                root = elem
+            if event == 'start':
+                if elem.tag in cls.GAME_TAGS:
+                    game = elem.get('name')
+                continue
+            if elem.tag in ('rom', 'disk'):
+                index._add(game, elem)
+            elif elem.tag in cls.GAME_TAGS:
+                # Drop the finished game so memory stays bounded
+                elem.clear()
+                root.clear()
+            elif elem.tag == 'name' and index.name is None and game is None:
+                index.name = elem.text
+        return index
+        
+    @classmethod
+    def load(cls, dat_file, cache_dir=DAT_CACHE_DIR):
+        """Return the cached index for dat_file, parsing it only when it changed"""
+        dat_file = Path(dat_file).resolve()
+        stat = dat_file.stat()
+        key = (cls.VERSION, str(dat_file), stat.st_size, stat.st_mtime_ns)
+        cache_file = None
+        if cache_dir:
+            digest = hashlib.sha1(str(dat_file).encode()).hexdigest()
+            cache_file = Path(cache_dir) / f"{digest}.pickle"
+            try:
+                with open(cache_file, 'rb') as f:
+                    cached_key, index = pickle.load(f)
+                if cached_key == key:
+                    return index
+            except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+                pass
+                
+        index = cls.parse(dat_file)
+        if cache_file:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache_file.with_suffix('.tmp')
+            with open(tmp, 'wb') as f:
+                pickle.dump((key, index), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache_file)
+        return index
+        
+    def match(self, rom):
+        """Return (entry index, headerless) for a ROMRecord, or (None, False)"""
+        for headerless, sha1, md5, crc in (
+                (False, rom.sha1_digest, rom.md5_digest, rom.crc32_value),
+                (True, *(rom.payload_digests or (None, None, None)))):
+            if crc is None:
+                continue
+            i = self.by_sha1.get(sha1) if sha1 else None
+            if i is None and md5:
+                i = self.by_md5.get(md5)
+            if i is None:
+                size = rom.size - rom.header_size if headerless else rom.size
+                i = self.by_crc_size.get((crc, size))
+            if i is not None:
+                return i, headerless
+        return None, False
+        
+    def entry_name(self, i):
+        game, name = self.entries[i][:2]
+        return f"{game}/{name}" if game and game != name else name
+
+
+class NDJSONCatalogWriter:
+    """Stream a catalog as newline-delimited JSON while it is being scanned
+    
+    Line one is a header record, then one {"record": "rom", ...} line per
+    ROM, and a final {"record": "stats", ...} trailer that also tells
+    readers the catalog is complete.
+    """
+    
+    FORMAT = 'n01d-rom-catalog'
+    VERSION = 1
+    FLUSH_EVERY = 256
+    
+    def __init__(self, output_file, root=None):
+        self.output_file = output_file
+        self.f = open(output_file, 'w')
+        self.count = 0
+        self._write({'record': 'header', 'format': self.FORMAT,
+                     'version': self.VERSION, 'root': str(root) if root else None,
+                     'created': datetime.now().isoformat()})
+        self.f.flush()
+        
+    def _write(self, record):
+        self.f.write(json.dumps(record))
+        self.f.write('\n')
+        
+    def write_rom(self, rom_info):
+        self._write({'record': 'rom', **rom_info.to_dict()})
+        self.count += 1
+        # Periodic flushes let consumers tail the file during long scans
+        if self.count % self.FLUSH_EVERY == 0:
+            self.f.flush()
+            
+    def close(self, stats):
+        self._write({'record': 'stats', 'stats': stats})
+        self.f.close()
+
+
 class ROMManager:
     """Manage ROM collections"""
     
-    def __init__(self, rom_dir):
-        self.rom_dir = Path(rom_dir)
+    def __init__(self, rom_dir, exclude=(), archives=False, crc_only=False):
+        # Absolute, so cache, catalog and journal keys don't depend on the cwd
+        self.rom_dir = Path(rom_dir).resolve()
+        self.exclude = tuple(exclude)
+        self.archives = archives
+        self.crc_only = crc_only
         self.catalog = {'roms': [], 'platforms': {}, 'stats': {}}
         
-    def scan_directory(self, recursive=True):
-        """Scan directory for ROMs"""
-        pattern = '**/*' if recursive else '*'
+    def scan_directory(self, recursive=True, jobs=1, use_processes=False, cache=None,
+                       on_rom=None, keep=True):
+        """Scan directory for ROMs
         
-        for filepath in self.rom_dir.glob(pattern):
-            if filepath.is_file():
-                platform = self._identify_platform(filepath)
-                if platform:
-                    rom_info = self._analyze_rom(filepath, platform)
-                    self.catalog['roms'].append(rom_info)
+        With jobs > 1 files are hashed on a thread pool (hashlib releases
+        the GIL) or a process pool; catalog order is the same either way.
+        Given a ScanCache, unchanged files are taken from it without rehashing.
+        on_rom is called with each ROM as soon as it is analyzed; with
+        keep=False ROMs are not held in the catalog and only stats are kept.
+        """
+        misses = {}
+        seen = set()
+        total_size = 0
+        by_platform = {}
+        
+        def jobs_for(found):
+            for filepath, candidates, stat in found:
+                path = str(filepath)
+                seen.add(path)
+                is_archive = candidates == (ARCHIVE,)
+                cached = None
+                if cache:
+                    cached = cache.lookup(path, stat, None if is_archive else candidates,
+                                          not self.crc_only, is_archive)
+                if cached is not None:
+                    yield resolved((path, cached))
+                    continue
+                if len(candidates) == 1:
+                    platform = candidates[0]
+                else:
+                    platform = disambiguate_platform(path, candidates, stat.st_size)
+                misses[path] = stat, is_archive
+                yield filepath, platform, stat, self.crc_only
                     
-                    if platform not in self.catalog['platforms']:
-                        self.catalog['platforms'][platform] = []
-                    self.catalog['platforms'][platform].append(rom_info)
+        results = ordered_map(analyze_path, jobs_for(self._find_roms(recursive)),
+                              jobs, use_processes)
+        for path, records in results:
+            miss = misses.pop(path, None)
+            if cache and miss is not None:
+                cache.store(path, records, *miss)
+                
+            for rom_info in records:
+                if on_rom:
+                    on_rom(rom_info)
                     
-        self._calculate_stats()
+                platform = rom_info.platform
+                total_size += rom_info.size
+                by_platform[platform] = by_platform.get(platform, 0) + 1
+                if keep:
+                    self._add_record(rom_info)
+                    
+        if cache and recursive:
+            cache.prune(self.rom_dir, seen)
+        self._calculate_stats(total_size, by_platform)
         return self.catalog
         
-    def _identify_platform(self, filepath):
-        """Identify ROM platform by extension"""
-        ext = filepath.suffix.lower()
-        for platform, extensions in PLATFORMS.items():
-            if ext in extensions:
-                return platform
-        return None
+    def _add_record(self, rom_info):
+        """Append a record and index it under its platform"""
+        roms = self.catalog['roms']
+        platforms = self.catalog['platforms']
+        if rom_info.platform not in platforms:
+            platforms[rom_info.platform] = array('I')
+        platforms[rom_info.platform].append(len(roms))
+        roms.append(rom_info)
         
-    def _analyze_rom(self, filepath, platform):
-        """Analyze individual ROM file"""
-        stat = filepath.stat()
+    def _extensions(self):
+        return ROM_EXTENSIONS | ARCHIVE_EXTENSIONS if self.archives else ROM_EXTENSIONS
         
-        # Calculate hashes
-        with open(filepath, 'rb') as f:
-            data = f.read()
-            md5 = hashlib.md5(data).hexdigest()
-            sha1 = hashlib.sha1(data).hexdigest()
-            crc32 = format(hashlib.new('crc32', data).digest()[-4:].hex(), 's')
-            
-        return {
-            'name': filepath.stem,
-            'filename': filepath.name,
-            'path': str(filepath),
-            'platform': platform,
-            'size': stat.st_size,
-            'size_human': self._human_size(stat.st_size),
-            'md5': md5,
-            'sha1': sha1,
-            'modified': datetime.fromtimestamp(stat.st_mtime).isoformat()
-        }
+    def scan_file(self, path, cache=None):
+        """Records for one file, analyzed as scan_directory would; [] if gone or not a ROM"""
+        name = os.path.basename(path)
+        dot = name.rfind('.')
+        ext = name[dot:].lower() if dot > 0 else ''
+        if self.archives and ext in ARCHIVE_EXTENSIONS:
+            candidates = (ARCHIVE,)
+        elif ext in EXTENSION_INDEX:
+            candidates = EXTENSION_INDEX[ext]
+        else:
+            return []
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return []
+        if not stat_module.S_ISREG(stat.st_mode):
+            return []
+        is_archive = candidates == (ARCHIVE,)
+        if cache:
+            cached = cache.lookup(path, stat, None if is_archive else candidates,
+                                  not self.crc_only, is_archive)
+            if cached is not None:
+                return cached
+        if len(candidates) == 1:
+            platform = candidates[0]
+        else:
+            platform = disambiguate_platform(path, candidates, stat.st_size)
+        try:
+            _, records = analyze_path(Path(path), platform, stat, self.crc_only)
+        except (OSError, zipfile.BadZipFile):
+            # Most likely still being written; the next event retries it
+            return []
+        if cache:
+            cache.store(path, records, stat, is_archive)
+        return records
+        
+    def update_paths(self, changed):
+        """Swap in fresh records for each path in changed (path -> records, [] if removed)
+        
+        Returns (added, removed) record counts. The platform index and stats
+        are rebuilt from the updated list.
+        """
+        old = self.catalog['roms']
+        kept = [rom for rom in old if rom.path not in changed]
+        self.catalog['roms'] = []
+        self.catalog['platforms'] = {}
+        for rom in kept:
+            self._add_record(rom)
+        added = 0
+        for records in changed.values():
+            for rom in records:
+                self._add_record(rom)
+                added += 1
+        self._calculate_stats()
+        return added, len(old) - len(kept)
+        
+    def watch(self, recursive=True, cache=None, on_update=None, debounce=WATCH_DEBOUNCE,
+              poll_interval=WATCH_POLL_INTERVAL, stop=None):
+        """Keep the catalog current as files change, until stop() is true
+        
+        Events come from inotify, or from polling where it is unavailable.
+        Each path is rehashed once it has been quiet for debounce seconds, so
+        a file being copied in is hashed once, after the copy. on_update is
+        called with the {path: records} batch after the catalog is updated.
+        """
+        extensions = self._extensions()
+        watcher = open_watcher(self.rom_dir, extensions, recursive, self.exclude, poll_interval)
+        self.watch_backend = 'inotify' if isinstance(watcher, InotifyWatcher) else 'polling'
+        pending = {}
+        
+        def recheck_tree(directory):
+            if os.path.isdir(directory):
+                for entry in walk_files(directory, extensions, recursive, self.exclude):
+                    pending[entry.path] = deadline
+            prefix = os.path.join(directory, '')
+            for rom in self.catalog['roms']:
+                if rom.path.startswith(prefix):
+                    pending[rom.path] = deadline
+                    
+        try:
+            while not (stop and stop()):
+                timeout = 1.0
+                if pending:
+                    timeout = min(timeout, max(0, min(pending.values()) - time.monotonic()))
+                changes = watcher.read(timeout)
+                deadline = time.monotonic() + debounce
+                for path, kind in changes:
+                    if kind == 'file':
+                        pending[path] = deadline
+                    elif kind == 'dir':
+                        recheck_tree(path)
+                    else:
+                        recheck_tree(os.fspath(self.rom_dir))
+                        
+                now = time.monotonic()
+                due = [path for path, when in pending.items() if when <= now]
+                if not due:
+                    continue
+                changed = {}
+                for path in due:
+                    del pending[path]
+                    changed[str(Path(path))] = self.scan_file(path, cache)
+                added, removed = self.update_paths(changed)
+                if cache:
+                    cache.commit()
+                if on_update and (added or removed):
+                    on_update(changed)
+        finally:
+            watcher.close()
+        return self.catalog
+        
+    def _find_roms(self, recursive=True):
+        """Yield (filepath, candidate platforms, stat) for every recognised ROM file
+        
+        With archive scanning on, archives get the single candidate ARCHIVE.
+        """
+        for entry in walk_files(self.rom_dir, self._extensions(), recursive, self.exclude):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            name = entry.name
+            ext = name[name.rfind('.'):].lower()
+            if self.archives and ext in ARCHIVE_EXTENSIONS:
+                yield Path(entry.path), (ARCHIVE,), stat
+            else:
+                yield Path(entry.path), EXTENSION_INDEX[ext], stat
         
     def _human_size(self, size):
         """Convert bytes to human readable"""
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size < 1024:
-                return f"{size:.1f} {unit}"
-            size /= 1024
-        return f"{size:.1f} TB"
-        
-    def _calculate_stats(self):
-        """Calculate collection statistics"""
-        total_size = sum(r['size'] for r in self.catalog['roms'])
+        return human_size(size)
+        
+    def _calculate_stats(self, total_size=None, by_platform=None):
+        """Calculate collection statistics, or record ones counted during a scan"""
+        if total_size is None:
+            total_size = sum(r.size for r in self.catalog['roms'])
+        if by_platform is None:
+            by_platform = {p: len(idx) for p, idx in self.catalog['platforms'].items()}
         self.catalog['stats'] = {
-            'total_roms': len(self.catalog['roms']),
+            'total_roms': sum(by_platform.values()),
             'total_size': total_size,
             'total_size_human': self._human_size(total_size),
-            'platforms': len(self.catalog['platforms']),
-            'by_platform': {p: len(roms) for p, roms in self.catalog['platforms'].items()}
+            'platforms': len(by_platform),
+            'by_platform': by_platform
         }
         
-    def find_duplicates(self):
-        """Find duplicate ROMs by hash"""
+    def find_duplicates(self, headerless=False):
+        """Find duplicate ROMs by hash
+        
+        With headerless=True the payload hash is compared, so dumps that only
+        differ by a copier or emulator header count as duplicates.
+        """
         md5_map = {}
         duplicates = []
         
         for rom in self.catalog['roms']:
-            md5 = rom['md5']
-            if md5 in md5_map:
+            digest = rom.payload_md5_digest if headerless else rom.md5_digest
+            if digest is None:
+                continue
+            if digest in md5_map:
+                original = md5_map[digest]
                 duplicates.append({
-                    'original': md5_map[md5],
-                    'duplicate': rom['path'],
-                    'md5': md5
+                    'original': original.location,
+                    'duplicate': rom.location,
+                    'md5': digest.hex(),
+                    'archived': bool(original.member or rom.member)
                 })
             else:
-                md5_map[md5] = rom['path']
+                md5_map[digest] = rom
                 
         return duplicates
         
-    def verify_rom(self, filepath, expected_hash):
-        """Verify ROM against known good hash"""
-        with open(filepath, 'rb') as f:
-            data = f.read()
+    def find_duplicates_staged(self, recursive=True, jobs=1,
+                               sample_size=DEDUPE_SAMPLE_SIZE):
+        """Find duplicate ROMs without a full scan
+        
+        Files are grouped by size first; only sizes shared by several files
+        get their first and last sample_size bytes hashed, and only files
+        still tied after that are hashed in full. Returns the duplicate list
+        in find_duplicates' format plus a stats dict with the bytes read.
+        """
+        by_size = {}
+        for filepath, _, stat in self._find_roms(recursive):
+            by_size.setdefault(stat.st_size, []).append(str(filepath))
+            
+        stats = {'files': sum(len(paths) for paths in by_size.values()),
+                 'total_bytes': sum(size * len(paths) for size, paths in by_size.items()),
+                 'candidates': 0, 'full_hashed': 0, 'bytes_read': 0}
+        
+        # Stage 2: head + tail sample of every file in a shared-size bucket
+        candidates = [(path, size) for size, paths in by_size.items()
+                      if len(paths) > 1 for path in paths]
+        stats['candidates'] = len(candidates)
+        groups = {}
+        for (path, size), (digest, read, complete) in zip(
+                candidates, ordered_map(sample_hash, candidates, jobs)):
+            stats['bytes_read'] += read
+            groups.setdefault((size, digest), []).append((path, complete))
+            
+        # Stage 3: full hash only where the sample is still tied
+        tied = [(path,) for members in groups.values() if len(members) > 1
+                for path, complete in members if not complete]
+        full = dict(zip((path for path, in tied), ordered_map(full_md5, tied, jobs)))
+        stats['full_hashed'] = len(tied)
+        stats['bytes_read'] += sum(size for (size, _), members in groups.items()
+                                   for path, _ in members if path in full)
+        
+        order = {path: i for i, (path, _) in enumerate(candidates)}
+        md5_map = {}
+        duplicates = []
+        for (size, digest), members in groups.items():
+            if len(members) < 2:
+                continue
+            for path, complete in members:
+                md5 = digest if complete else full[path]
+                if md5 in md5_map:
+                    duplicates.append({
+                        'original': md5_map[md5],
+                        'duplicate': path,
+                        'md5': md5
+                    })
+                else:
+                    md5_map[md5] = path
+        duplicates.sort(key=lambda dup: order[dup['duplicate']])
+        return duplicates, stats
+        
+    def link_duplicates(self, duplicates, mode='auto', dry_run=True,
+                        journal=DEDUPE_JOURNAL_FILE):
+        """Reclaim space by replacing duplicates with links to their original
+        
+        mode is 'hardlink', 'reflink' or 'auto' (reflink, falling back to a
+        hardlink where the filesystem can't clone). Every pair is compared
+        byte-for-byte before linking; a dry run skips that read and only
+        reports the plan. Completed links are appended to journal so
+        undo_links can split them again.
+        """
+        plan = []
+        summary = {'linked': 0, 'skipped': 0, 'bytes_saved': 0}
+        journal_file = None
+        if not dry_run and journal:
+            Path(journal).parent.mkdir(parents=True, exist_ok=True)
+            journal_file = open(journal, 'a')
+            
+        try:
+            for dup in duplicates:
+                original, duplicate = dup['original'], dup['duplicate']
+                step = {'original': original, 'duplicate': duplicate,
+                        'mode': mode, 'status': 'planned'}
+                plan.append(step)
+                if dup.get('archived'):
+                    step['status'] = 'skipped: inside archive'
+                    summary['skipped'] += 1
+                    continue
+                try:
+                    st_orig = os.stat(original)
+                    st_dup = os.stat(duplicate)
+                except OSError as e:
+                    step['status'] = f'skipped: {e.strerror}'
+                    summary['skipped'] += 1
+                    continue
+                step['size'] = st_dup.st_size
+                
+                if (st_orig.st_dev, st_orig.st_ino) == (st_dup.st_dev, st_dup.st_ino):
+                    step['status'] = 'skipped: already linked'
+                elif st_orig.st_size != st_dup.st_size:
+                    step['status'] = 'skipped: size differs'
+                elif mode == 'hardlink' and st_orig.st_dev != st_dup.st_dev:
+                    step['status'] = 'skipped: different filesystem'
+                if step['status'] != 'planned':
+                    summary['skipped'] += 1
+                    continue
+                    
+                if dry_run:
+                    summary['bytes_saved'] += st_dup.st_size
+                    continue
+                    
+                if not files_identical(original, duplicate):
+                    step['status'] = 'skipped: content differs'
+                    summary['skipped'] += 1
+                    continue
+                    
+                used = mode
+                try:
+                    if mode in ('reflink', 'auto'):
+                        used = 'reflink'
+                        try:
+                            _replace_with_link(original, duplicate, 'reflink')
+                        except OSError as e:
+                            if mode == 'reflink' or e.errno not in (
+                                    errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV,
+                                    errno.EINVAL, errno.ENOSYS):
+                                raise
+                            used = 'hardlink'
+                    if used == 'hardlink':
+                        if st_orig.st_dev != st_dup.st_dev:
+                            step['status'] = 'skipped: different filesystem'
+                            summary['skipped'] += 1
+                            continue
+                        _replace_with_link(original, duplicate, 'hardlink')
+                except OSError as e:
+                    step['status'] = f'failed: {e.strerror}'
+                    summary['skipped'] += 1
+                    continue
+                    
+                step['mode'] = used
+                step['status'] = 'linked'
+                summary['linked'] += 1
+                summary['bytes_saved'] += st_dup.st_size
+                if journal_file:
+                    journal_file.write(json.dumps({
+                        'original': original, 'duplicate': duplicate,
+                        'mode': used, 'size': st_dup.st_size}) + '\n')
+                    journal_file.flush()
+                    os.fsync(journal_file.fileno())
+        finally:
+            if journal_file:
+                journal_file.close()
+                
+        return plan, summary
+        
+    def undo_links(self, journal=DEDUPE_JOURNAL_FILE):
+        """Give every file linked by link_duplicates its own copy of the data again
+        
+        Returns (restored, skipped). A reflinked duplicate is an independent
+        file that may have been edited since, so it is only rewritten while
+        it still matches the original byte for byte.
+        """
+        restored = skipped = 0
+        with open(journal) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
             
-        actual_md5 = hashlib.md5(data).hexdigest()
-        actual_sha1 = hashlib.sha1(data).hexdigest()
+        for entry in reversed(entries):
+            original, duplicate = entry['original'], entry['duplicate']
+            try:
+                st_orig = os.stat(original)
+                st_dup = os.stat(duplicate)
+                same_inode = (st_orig.st_dev, st_orig.st_ino) == (st_dup.st_dev, st_dup.st_ino)
+                if entry['mode'] == 'hardlink' and not same_inode:
+                    # Already split apart since it was linked
+                    continue
+                if not same_inode and not files_identical(original, duplicate):
+                    skipped += 1
+                    continue
+            except OSError:
+                skipped += 1
+                continue
+            # A plain copy (no copy_file_range) so reflinked extents are unshared too
+            tmp = os.path.join(os.path.dirname(duplicate),
+                               f".{os.path.basename(duplicate)}.undo-tmp")
+            try:
+                with open(original, 'rb') as fsrc, open(tmp, 'wb') as fdst:
+                    shutil.copyfileobj(fsrc, fdst, HASH_CHUNK_SIZE)
+                shutil.copystat(original, tmp)
+                os.replace(tmp, duplicate)
+            except OSError:
+                if os.path.lexists(tmp):
+                    os.unlink(tmp)
+                skipped += 1
+                continue
+            restored += 1
+        return restored, skipped
+        
+    def verify_catalog(self, dat):
+        """Audit every scanned ROM against a DatIndex
+        
+        Returns good (hash found), bad (file name known to the DAT but the
+        hash differs), unknown (not in the DAT) and missing (DAT entries no
+        ROM matched) lists.
+        """
+        report = {'good': [], 'bad': [], 'unknown': [], 'missing': []}
+        matched = set()
+        for rom in self.catalog['roms']:
+            i, headerless = dat.match(rom)
+            if i is not None:
+                matched.add(i)
+                report['good'].append({'path': rom.location, 'entry': dat.entry_name(i),
+                                       'headerless': headerless})
+                continue
+            i = dat.by_name.get(rom.filename.lower())
+            if i is not None:
+                report['bad'].append({'path': rom.location, 'entry': dat.entry_name(i)})
+            else:
+                report['unknown'].append({'path': rom.location})
+        report['missing'] = [dat.entry_name(i) for i in range(len(dat.entries))
+                             if i not in matched]
+        return report
+        
+    def verify_rom(self, filepath, expected_hash):
+        """Verify ROM against known good hash (raw or headerless)"""
+        with open(filepath, 'rb', buffering=0) as f:
+            _, hashes = hash_rom(f, os.fstat(f.fileno()).st_size)
         
-        if expected_hash.lower() in [actual_md5, actual_sha1]:
+        expected = expected_hash.lower()
+        if expected in (hashes['md5'], hashes['sha1'], hashes['crc32']):
             return True, "Hash matches"
-        return False, f"Hash mismatch. Got MD5: {actual_md5}"
+        if expected in (hashes['payload_md5'], hashes['payload_sha1'], hashes['payload_crc32']):
+            return True, "Hash matches (headerless)"
+        return False, f"Hash mismatch. Got MD5: {hashes['md5']}"
         
-    def organize(self, dest_dir, by='platform', dry_run=True):
-        """Organize ROMs into folders"""
-        dest = Path(dest_dir)
+    @staticmethod
+    def organize_journal(dest_dir):
+        """Journal that makes an interrupted organize resumable"""
+        return Path(dest_dir) / ".organize-journal.ndjson"
+        
+    def plan_organize(self, dest_dir, by='platform'):
+        """Work out every move up front, renaming targets that would collide"""
+        dest = Path(dest_dir).resolve()
         moves = []
+        planned = set()
         
         for rom in self.catalog['roms']:
+            # Archives hold several records but move as one file
+            if rom.path in planned:
+                continue
+            planned.add(rom.path)
             if by == 'platform':
-                target_dir = dest / rom['platform']
+                target_dir = dest / rom.platform
             elif by == 'letter':
-                first_letter = rom['name'][0].upper()
+                first_letter = rom.name[0].upper()
                 if not first_letter.isalpha():
                     first_letter = '#'
                 target_dir = dest / first_letter
             else:
                 target_dir = dest
                 
-            target_path = target_dir / rom['filename']
-            moves.append({
-                'source': rom['path'],
-                'dest': str(target_path)
-            })
+            target = str(target_dir / os.path.basename(rom.path))
+            move = {'source': rom.path, 'dest': target, 'status': 'planned',
+                    'md5': None if rom.member else rom.md5}
+            if os.path.abspath(target) == os.path.abspath(rom.path):
+                move['status'] = 'in place'
+            else:
+                unique = _unique_target(target, planned)
+                if unique != target:
+                    move['dest'] = unique
+                    move['collision'] = target
+            planned.add(move['dest'])
+            moves.append(move)
+        return moves
+        
+    def organize(self, dest_dir, by='platform', dry_run=True, jobs=1):
+        """Organize ROMs into folders
+        
+        All moves are planned first, with colliding names renamed. Moves
+        that stay on one filesystem are plain renames, done in order. Moves
+        to another filesystem are copied in parallel with copy_file_range or
+        sendfile, checked against the catalog MD5 (or byte-for-byte), and
+        only then is the source removed. Every step is journaled in
+        dest_dir; if an earlier run was interrupted, its journal is resumed
+        instead of planning again.
+        """
+        journal = self.organize_journal(dest_dir)
+        if not dry_run and journal.exists():
+            moves, done = self._load_organize_journal(journal)
+            for move in moves:
+                if move['source'] in done:
+                    move['status'] = 'done'
+                    move['resumed'] = True
+        else:
+            moves = self.plan_organize(dest_dir, by)
             
-            if not dry_run:
-                target_dir.mkdir(parents=True, exist_ok=True)
-                Path(rom['path']).rename(target_path)
-                
+        if dry_run:
+            return moves
+            
+        Path(dest_dir).mkdir(parents=True, exist_ok=True)
+        lock = threading.Lock()
+        journal_file = open(journal, 'a')
+        if journal_file.tell() == 0:
+            for move in moves:
+                journal_file.write(json.dumps({'op': 'plan', **move}) + '\n')
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+            
+        def record(move, status):
+            move['status'] = status
+            if status in ('moved', 'copied'):
+                with lock:
+                    journal_file.write(json.dumps({'op': 'done', 'source': move['source']}) + '\n')
+                    # Flushed per move so a killed run doesn't lose renames it made
+                    journal_file.flush()
+                    
+        pending = [m for m in moves if m['status'] == 'planned']
+        cross_device = []
+        try:
+            # Same-device renames are metadata-only; batch them with one fsync
+            for move in pending:
+                try:
+                    if not os.path.lexists(move['source']) and os.path.lexists(move['dest']):
+                        # Renamed by an interrupted run after its last fsync
+                        record(move, 'moved')
+                        continue
+                    if _device_of(move['source']) != _device_of(move['dest']):
+                        cross_device.append(move)
+                        continue
+                    os.makedirs(os.path.dirname(move['dest']), exist_ok=True)
+                    if os.path.lexists(move['dest']):
+                        record(move, 'failed: destination exists')
+                        continue
+                    os.rename(move['source'], move['dest'])
+                    record(move, 'moved')
+                except OSError as e:
+                    if e.errno == errno.EXDEV:
+                        cross_device.append(move)
+                    else:
+                        record(move, f'failed: {e.strerror}')
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+            
+            for move, error in zip(cross_device, ordered_map(
+                    self._move_across_devices, ((m,) for m in cross_device), jobs)):
+                record(move, f'failed: {error}' if error else 'copied')
+        finally:
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+            journal_file.close()
+            
+        if not any(m['status'].startswith('failed') for m in moves):
+            journal.unlink()
         return moves
         
-    def export_catalog(self, output_file):
-        """Export catalog to JSON"""
+    @staticmethod
+    def _load_organize_journal(journal):
+        moves = []
+        done = set()
+        with open(journal) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn final line from the interrupted run
+                    continue
+                op = entry.pop('op')
+                if op == 'plan':
+                    moves.append(entry)
+                elif op == 'done':
+                    done.add(entry['source'])
+        return moves, done
+        
+    @staticmethod
+    def _move_across_devices(move):
+        """Copy, verify, then unlink the source; returns an error string or None"""
+        source, dest = move['source'], move['dest']
+        part = dest + '.part'
+        try:
+            if not os.path.exists(source):
+                # Interrupted after the source was removed: the copy is complete
+                return None if os.path.exists(dest) else 'source missing'
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if not os.path.exists(dest):
+                copy_file_fast(source, part)
+                shutil.copystat(source, part)
+                os.replace(part, dest)
+            if move.get('md5'):
+                verified = full_md5(dest) == move['md5']
+            else:
+                verified = files_identical(source, dest)
+            if not verified:
+                os.unlink(dest)
+                return 'verification failed'
+            os.unlink(source)
+            return None
+        except OSError as e:
+            if os.path.lexists(part):
+                os.unlink(part)
+            return e.strerror
+            
+    def export_catalog(self, output_file, fmt=None):
+        """Export catalog to JSON, or NDJSON for .ndjson/.jsonl files"""
+        if (fmt or catalog_format(output_file)) == 'ndjson':
+            writer = NDJSONCatalogWriter(output_file, self.rom_dir)
+            for rom in self.catalog['roms']:
+                writer.write_rom(rom)
+            writer.close(self.catalog['stats'])
+            return output_file
+            
+        # Written record by record; platforms are index lists into 'roms'
         with open(output_file, 'w') as f:
-            json.dump(self.catalog, f, indent=2)
+            f.write('{\n  "roms": [')
+            for i, rom in enumerate(self.catalog['roms']):
+                f.write(',\n    ' if i else '\n    ')
+                f.write(json.dumps(rom.to_dict()))
+            f.write('\n  ],\n  "platforms": ')
+            f.write(json.dumps({p: list(idx) for p, idx in self.catalog['platforms'].items()}))
+            f.write(',\n  "stats": ')
+            f.write(json.dumps(self.catalog['stats']))
+            f.write('\n}\n')
         return output_file
 
 
@@ -195,16 +2141,61 @@ def main():
                        help="Scan and catalog ROMs")
     parser.add_argument("-d", "--duplicates", action="store_true",
                        help="Find duplicate ROMs")
+    parser.add_argument("--headerless", action="store_true",
+                       help="Match duplicates on payload hashes, ignoring copier headers")
+    parser.add_argument("--link", choices=['hardlink', 'reflink', 'auto'],
+                       help="Replace verified duplicates with links to reclaim space")
+    parser.add_argument("--journal", metavar="FILE", default=str(DEDUPE_JOURNAL_FILE),
+                       help="Undo journal for --link (default: %(default)s)")
+    parser.add_argument("--undo-links", metavar="JOURNAL",
+                       help="Split files linked by --link back into separate copies")
     parser.add_argument("-o", "--organize", metavar="DEST",
                        help="Organize ROMs into destination folder")
     parser.add_argument("--by", choices=['platform', 'letter'],
                        default='platform', help="Organization method")
     parser.add_argument("--export", metavar="FILE",
-                       help="Export catalog to JSON")
+                       help="Export catalog to JSON (.ndjson/.jsonl streams during the scan)")
+    parser.add_argument("--db", nargs='?', const=str(CATALOG_DB_FILE), metavar="FILE",
+                       help="Store the scan in an SQLite catalog (default: %(const)s)")
+    parser.add_argument("--find-hash", metavar="HASH",
+                       help="Query the catalog DB by CRC32, MD5 or SHA1")
+    parser.add_argument("--list-platform", metavar="PLATFORM",
+                       help="Query the catalog DB for one platform's ROMs")
+    parser.add_argument("--find-name", metavar="NAME",
+                       help="Query the catalog DB by name prefix (* and ? wildcards)")
     parser.add_argument("-v", "--verify", nargs=2, metavar=('FILE', 'HASH'),
                        help="Verify ROM against hash")
+    parser.add_argument("--dat", metavar="FILE",
+                       help="Audit the scanned collection against a No-Intro/Redump/MAME XML DAT")
+    parser.add_argument("--dat-report", metavar="FILE",
+                       help="Write the full --dat audit as JSON")
+    parser.add_argument("--probe", nargs='+', metavar="FILE",
+                       help="Identify ROMs from their headers")
     parser.add_argument("--no-recursive", action="store_true",
                        help="Don't scan subdirectories")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                       help="Skip directories matching PATTERN (repeatable)")
+    parser.add_argument("--archives", action="store_true",
+                       help="Catalog ROMs inside .zip (and .7z/.lha with libarchive-c)")
+    parser.add_argument("--crc-only", action="store_true",
+                       help="With --archives, take zip members' CRC32 from the directory "
+                            "without decompressing")
+    parser.add_argument("-j", "--jobs", type=int, default=1, metavar="N",
+                       help="Hash files with N parallel workers (0 = one per CPU)")
+    parser.add_argument("--processes", action="store_true",
+                       help="Use a process pool instead of threads for --jobs")
+    parser.add_argument("--cache", metavar="FILE", default=str(SCAN_CACHE_FILE),
+                       help="Scan cache database (default: %(default)s)")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="Rehash every file instead of using the scan cache")
+    parser.add_argument("--watch", action="store_true",
+                       help="After the scan, keep the catalog, --export and --db current "
+                            "as files change (Ctrl-C to stop)")
+    parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE, metavar="SECONDS",
+                       help="Quiet time before a changed file is rehashed (default: %(default)s)")
+    parser.add_argument("--poll-interval", type=float, default=WATCH_POLL_INTERVAL,
+                       metavar="SECONDS",
+                       help="Rescan period when inotify is unavailable (default: %(default)s)")
     parser.add_argument("--dry-run", action="store_true",
                        help="Show what would be done without doing it")
     
@@ -220,11 +2211,107 @@ def main():
             print(f"[✗] {msg}")
         sys.exit(0 if valid else 1)
         
-    manager = ROMManager(args.directory)
+    if args.undo_links:
+        restored, skipped = ROMManager('.').undo_links(args.undo_links)
+        print(f"[*] Restored {restored} independent copies from {args.undo_links}")
+        if skipped:
+            print(f"[✗] Skipped {skipped} that changed since linking or could not be copied")
+        return
+        
+    if args.find_hash or args.list_platform or args.find_name:
+        catalog_db = CatalogDB(args.db or CATALOG_DB_FILE)
+        try:
+            if args.find_hash:
+                roms = catalog_db.find_by_hash(args.find_hash)
+            elif args.list_platform:
+                roms = catalog_db.find_by_platform(args.list_platform)
+            else:
+                roms = catalog_db.find_by_name(args.find_name)
+        except ValueError as e:
+            print(f"[✗] {e}")
+            sys.exit(1)
+        finally:
+            catalog_db.close()
+        print(f"[*] {len(roms)} matching ROMs")
+        for rom in roms:
+            print(f"  {rom.platform:12} {rom.size_human:>10}  {rom.md5 or rom.crc32:32}  "
+                  f"{rom.location}")
+        sys.exit(0 if roms else 1)
+        
+    if args.probe:
+        for filepath in args.probe:
+            probe = probe_rom(filepath)
+            if not probe:
+                print(f"[✗] {filepath}: no known header")
+                continue
+            print(f"[✓] {filepath}")
+            print(f"    Platform: {probe['platform']}")
+            print(f"    Title:    {probe['title'] or '-'}")
+            print(f"    Header:   {probe['header_size']} bytes")
+            if probe['quirks']:
+                print(f"    Quirks:   {', '.join(probe['quirks'])}")
+        return
+        
+    manager = ROMManager(args.directory, args.exclude, args.archives or args.crc_only,
+                         args.crc_only)
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    writer = None
+    
+    # An interrupted organize resumes from its journal without rescanning
+    resume_organize = bool(args.organize and not args.dry_run and
+                           manager.organize_journal(args.organize).exists())
+    
+    # A duplicates-only run doesn't need every file hashed up front
+    staged_dedupe = args.duplicates and not any(
+        [args.scan, args.organize, args.export, args.headerless, args.watch])
     
-    if args.scan or args.duplicates or args.organize or args.export:
+    if staged_dedupe:
+        print(f"[*] Finding duplicates: {args.directory}")
+        dups, dedupe_stats = manager.find_duplicates_staged(not args.no_recursive, jobs)
+        print(f"\n[DEDUPE STATS]")
+        print(f"  Files: {dedupe_stats['files']}")
+        print(f"  Same-size candidates: {dedupe_stats['candidates']}")
+        print(f"  Fully hashed: {dedupe_stats['full_hashed']}")
+        print(f"  Read: {human_size(dedupe_stats['bytes_read'])} "
+              f"of {human_size(dedupe_stats['total_bytes'])}")
+    elif (args.scan or args.duplicates or args.export or args.db or args.dat or args.watch or
+          (args.organize and not resume_organize)):
+        cache = None if args.no_cache else ScanCache(args.cache)
+        
+        # NDJSON exports and the catalog DB are fed record by record as the scan runs
+        sinks = []
+        if args.export and catalog_format(args.export) == 'ndjson':
+            writer = NDJSONCatalogWriter(args.export, args.directory)
+            sinks.append(writer.write_rom)
+        catalog_db = None
+        if args.db:
+            catalog_db = CatalogDB(args.db)
+            catalog_db.begin_scan()
+            sinks.append(catalog_db.add)
+        keep = (not sinks or bool(args.duplicates or args.organize or args.dat or args.watch) or
+                bool(args.export and not writer))
+        
+        def on_rom(rom):
+            for sink in sinks:
+                sink(rom)
+                
         print(f"[*] Scanning: {args.directory}")
-        manager.scan_directory(not args.no_recursive)
+        try:
+            manager.scan_directory(not args.no_recursive, jobs, args.processes, cache,
+                                   on_rom if sinks else None, keep)
+        finally:
+            if cache and not args.watch:
+                cache.close()
+        if writer:
+            writer.close(manager.catalog['stats'])
+        if catalog_db:
+            if not args.no_recursive:
+                catalog_db.finish_scan(manager.rom_dir)
+            if not args.watch:
+                catalog_db.close()
+            print(f"[*] Catalog database updated: {args.db}")
+        if cache:
+            print(f"[*] Cache: {cache.hits} unchanged, {cache.misses} hashed")
         
         stats = manager.catalog['stats']
         print(f"\n[COLLECTION STATS]")
@@ -238,28 +2325,102 @@ def main():
             print(f"  {platform:15} {count:5} ROMs")
             
     if args.duplicates:
-        dups = manager.find_duplicates()
+        if not staged_dedupe:
+            dups = manager.find_duplicates(args.headerless)
         print(f"\n[DUPLICATES] Found {len(dups)}")
         for dup in dups[:10]:
             print(f"  {dup['original']}")
             print(f"    ↳ {dup['duplicate']}")
+        if len(dups) > 10:
+            print(f"  ... and {len(dups) - 10} more")
+            
+        if args.link:
+            plan, summary = manager.link_duplicates(dups, args.link, args.dry_run,
+                                                    args.journal)
+            action = "Would link" if args.dry_run else "Linked"
+            print(f"\n[LINK] {action} {len(plan) - summary['skipped']} files "
+                  f"({args.link}), skipped {summary['skipped']}")
+            print(f"  Space reclaimed: {human_size(summary['bytes_saved'])}")
+            for step in plan:
+                if step['status'].startswith(('skipped', 'failed')):
+                    print(f"  [{step['status']}] {step['duplicate']}")
+            if not args.dry_run and summary['linked']:
+                print(f"  Undo journal: {args.journal}")
+            
+    if args.dat:
+        print(f"\n[*] Loading DAT: {args.dat}")
+        dat = DatIndex.load(args.dat)
+        report = manager.verify_catalog(dat)
+        print(f"\n[DAT AUDIT] {dat.name or Path(args.dat).name} ({len(dat.entries)} entries)")
+        for status in ('good', 'bad', 'unknown', 'missing'):
+            print(f"  {status.capitalize():8} {len(report[status]):7}")
+        for item in report['bad'][:10]:
+            print(f"  [bad] {item['path']} (expected {item['entry']})")
+        if args.dat_report:
+            with open(args.dat_report, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"[*] Audit report saved: {args.dat_report}")
             
     if args.organize:
-        moves = manager.organize(args.organize, args.by, args.dry_run)
+        if resume_organize:
+            print(f"[*] Resuming interrupted organize: {manager.organize_journal(args.organize)}")
+        moves = manager.organize(args.organize, args.by, args.dry_run, jobs)
         action = "Would move" if args.dry_run else "Moving"
         print(f"\n[ORGANIZE] {action} {len(moves)} files")
         for move in moves[:5]:
             print(f"  {move['source']} → {move['dest']}")
         if len(moves) > 5:
             print(f"  ... and {len(moves) - 5} more")
+        counts = {}
+        for move in moves:
+            status = move['status'].split(':')[0]
+            counts[status] = counts.get(status, 0) + 1
+        print(f"  {', '.join(f'{n} {status}' for status, n in counts.items())}")
+        for move in moves:
+            if 'collision' in move:
+                print(f"  [renamed] {move['collision']} → {move['dest']}")
+            if move['status'].startswith('failed'):
+                print(f"  [{move['status']}] {move['source']}")
             
     if args.export:
-        manager.export_catalog(args.export)
+        if not writer:
+            manager.export_catalog(args.export)
         print(f"\n[*] Catalog exported: {args.export}")
         
-    if not any([args.scan, args.duplicates, args.organize, args.export, args.verify]):
-        print("[*] Use --scan, --duplicates, --organize, --export, or --verify")
+    if args.watch:
+        def on_update(changed):
+            if catalog_db:
+                catalog_db.remove_paths(changed)
+                catalog_db.write(rom for records in changed.values() for rom in records)
+            if args.export:
+                # Replaced atomically so readers never see a half-written catalog
+                tmp = f"{args.export}.tmp"
+                manager.export_catalog(tmp, catalog_format(args.export))
+                os.replace(tmp, args.export)
+            stats = manager.catalog['stats']
+            for path, records in changed.items():
+                mark = '+' if records else '-'
+                print(f"  [{datetime.now():%H:%M:%S}] {mark} {path}")
+            print(f"  [{datetime.now():%H:%M:%S}] {stats['total_roms']} ROMs, "
+                  f"{stats['total_size_human']}")
+            
+        print(f"\n[*] Watching {args.directory} for changes (Ctrl-C to stop)")
+        try:
+            manager.watch(not args.no_recursive, cache, on_update, args.debounce,
+                          args.poll_interval)
+        except KeyboardInterrupt:
+            print("\n[*] Watch stopped")
+        finally:
+            if cache:
+                cache.close()
+            if catalog_db:
+                catalog_db.close()
+        
+    if not any([args.scan, args.duplicates, args.organize, args.export, args.db, args.dat,
+                args.verify, args.watch]):
+        print("[*] Use --scan, --duplicates, --organize, --export, --db, --verify, or --probe")
         print("[*] Example: rom-manager.py ~/roms --scan --export catalog.json")
+        print("[*] Example: rom-manager.py --find-hash 3fa1c2d4")
 
 
 if __name__ == "__main__":
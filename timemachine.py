@@ -14,17 +14,16 @@ import sys
 import json
 import subprocess
 import shutil
+import time
+import importlib.util
 from pathlib import Path
 from dataclasses import dataclass
 from typing import Optional, Dict, List
 import argparse
 
-try:
-    import customtkinter as ctk
-    from PIL import Image
-    GUI_AVAILABLE = True
-except ImportError:
-    GUI_AVAILABLE = False
+# The GUI stack (Tk, customtkinter, Pillow) is only imported by load_gui(),
+# so --list, --machine and --cli start without it
+GUI_MODULES = ("_tkinter", "customtkinter", "PIL")
 
 # N01D Color Scheme
 N01D_BG = "#0a0a0a"
@@ -38,6 +37,7 @@ CONFIG_DIR = Path.home() / ".timemachine"
 ROMS_DIR = CONFIG_DIR / "roms"
 DISKS_DIR = CONFIG_DIR / "disks"
 CONFIG_FILE = CONFIG_DIR / "config" / "machines.json"
+EMULATOR_CACHE_FILE = CONFIG_DIR / "cache" / "emulators.json"
 
 @dataclass
 class Machine:
@@ -279,12 +279,122 @@ class TimeMachineConfig:
         with open(CONFIG_FILE, 'w') as f:
             json.dump(self.config, f, indent=2)
 
+class EmulatorProbe:
+    """Locate emulators on PATH with one scandir per PATH directory
+    
+    Lookups are cached per binary (several machines share fs-uae, atari800,
+    ...) until PATH changes or one of its directories gets a new mtime, as
+    happens when a package is installed or removed. Results are saved to
+    EMULATOR_CACHE_FILE, so a new process with an unchanged PATH only stats
+    the PATH directories.
+    """
+    
+    # Seconds between PATH mtime checks, so a redrawn menu doesn't restat
+    RECHECK_INTERVAL = 1.0
+    
+    def __init__(self, cache_file: Path = EMULATOR_CACHE_FILE):
+        self.cache_file = cache_file
+        self.signature = None
+        self.checked = 0.0
+        self.executables = None
+        self.found: Dict[str, Optional[str]] = {}
+        self.dirty = False
+        self.load()
+        
+    def load(self):
+        try:
+            with open(self.cache_file) as f:
+                cached = json.load(f)
+            self.signature = cached['signature']
+            self.found = cached['found']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+            
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_file.with_suffix('.tmp')
+            with open(tmp, 'w') as f:
+                json.dump({'signature': self.signature, 'found': self.found}, f)
+            os.replace(tmp, self.cache_file)
+            self.dirty = False
+        except OSError:
+            pass
+            
+    def path_signature(self) -> list:
+        """[directory, mtime_ns] for each PATH entry, in order"""
+        signature = []
+        seen = set()
+        for directory in os.environ.get('PATH', os.defpath).split(os.pathsep):
+            directory = directory or '.'
+            if directory in seen:
+                continue
+            seen.add(directory)
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                mtime = None
+            signature.append([directory, mtime])
+        return signature
+        
+    def refresh(self):
+        """Drop cached results if PATH or a PATH directory changed"""
+        now = time.monotonic()
+        if now - self.checked < self.RECHECK_INTERVAL:
+            return
+        self.checked = now
+        signature = self.path_signature()
+        if signature != self.signature:
+            self.signature = signature
+            self.executables = None
+            self.found = {}
+            self.dirty = True
+            
+    def scan(self):
+        """Index every file name on PATH, keeping candidates in PATH order"""
+        self.executables = {}
+        for directory, mtime in self.signature:
+            if mtime is None:
+                continue
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        self.executables.setdefault(entry.name, []).append(entry.path)
+            except OSError:
+                continue
+                
+    def which(self, emulator: str) -> Optional[str]:
+        """Path of the emulator binary, like shutil.which"""
+        if os.name == 'nt' or os.path.dirname(emulator):
+            # PATHEXT and explicit paths are left to shutil
+            return shutil.which(emulator)
+        self.refresh()
+        if emulator not in self.found:
+            if self.executables is None:
+                self.scan()
+            self.found[emulator] = next(
+                (path for path in self.executables.get(emulator, ())
+                 if os.access(path, os.X_OK) and not os.path.isdir(path)), None)
+            self.dirty = True
+        return self.found[emulator]
+        
+    def probe(self, emulators) -> Dict[str, bool]:
+        """Availability of several emulators in one pass, saving the result"""
+        available = {emulator: self.which(emulator) is not None for emulator in emulators}
+        self.save()
+        return available
+
+EMULATOR_PROBE = EmulatorProbe()
+
 def check_emulator(emulator: str) -> bool:
     """Check if emulator is installed"""
-    return shutil.which(emulator) is not None
+    return EMULATOR_PROBE.which(emulator) is not None
 
 def get_available_machines() -> List[Machine]:
     """Return list of machines with available emulators"""
+    EMULATOR_PROBE.probe({machine.emulator for machine in MACHINES.values()})
     available = []
     for machine in MACHINES.values():
         if check_emulator(machine.emulator):
@@ -386,8 +496,16 @@ def interactive_menu():
             print(f"\n  Unknown machine: {choice}")
             input("  Press Enter to continue...")
 
+def gui_available() -> bool:
+    """Check the GUI stack is installed without importing it"""
+    return all(importlib.util.find_spec(name) is not None for name in GUI_MODULES)
+
 # GUI Application
-if GUI_AVAILABLE:
+def load_gui():
+    """Import the GUI stack and return the TimeMachineGUI class"""
+    import customtkinter as ctk
+    from PIL import Image
+    
     class TimeMachineGUI(ctk.CTk):
         """Time Machine GUI Application"""
         
@@ -533,6 +651,8 @@ if GUI_AVAILABLE:
                 self.update()
                 launch_machine(self.selected_machine)
                 self.status.configure(text="Select a machine to begin your journey")
+    
+    return TimeMachineGUI
 
 def main():
     parser = argparse.ArgumentParser(
@@ -580,11 +700,16 @@ def main():
         return
     
     # Default behavior
-    if args.gui or (GUI_AVAILABLE and not args.cli):
-        app = TimeMachineGUI()
-        app.mainloop()
-    else:
-        interactive_menu()
+    if args.gui or (not args.cli and gui_available()):
+        try:
+            TimeMachineGUI = load_gui()
+        except ImportError as e:
+            print(f"GUI unavailable ({e}), starting CLI mode")
+        else:
+            app = TimeMachineGUI()
+            app.mainloop()
+            return
+    interactive_menu()
 
 if __name__ == "__main__":
     main()